@@ -0,0 +1,90 @@
+# Copyright (c) Humanitarian OpenStreetMap Team
+# This file is part of fmtm-splitter.
+#
+#     fmtm-splitter is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     fmtm-splitter is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with fmtm-splitter.  If not, see <https:#www.gnu.org/licenses/>.
+#
+"""Database connection pool for the API."""
+
+from collections.abc import AsyncGenerator
+from logging import getLogger
+
+from anyio import CapacityLimiter, to_thread
+from litestar import Litestar, Request, Response
+from litestar.datastructures import State
+from litestar.status_codes import HTTP_500_INTERNAL_SERVER_ERROR
+from psycopg2 import Error
+from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool
+
+from api.settings import get_settings
+
+log = getLogger(__name__)
+
+
+def create_db_pool(app: Litestar) -> None:
+    """Open the shared connection pool on app startup."""
+    settings = get_settings()
+    log.debug(
+        f"Creating db connection pool ({settings.DB_POOL_MIN}-{settings.DB_POOL_MAX})"
+    )
+    app.state.db_pool = ThreadedConnectionPool(
+        settings.DB_POOL_MIN,
+        settings.DB_POOL_MAX,
+        settings.DB_URL,
+    )
+    # The pool raises PoolError once exhausted, so requests queue here instead
+    app.state.db_pool_limiter = CapacityLimiter(settings.DB_POOL_MAX)
+
+
+def close_db_pool(app: Litestar) -> None:
+    """Close all pooled connections on app shutdown."""
+    if pool := getattr(app.state, "db_pool", None):
+        log.debug("Closing db connection pool")
+        pool.closeall()
+
+
+async def provide_db_conn(state: State) -> AsyncGenerator[connection, None]:
+    """Borrow a connection from the pool for the duration of a request.
+
+    Waits for a free connection when all are in use. Calls that may block
+    on the network (opening a connection, rollback) run in a worker thread.
+    """
+    pool = state.db_pool
+    async with state.db_pool_limiter:
+        conn = await to_thread.run_sync(pool.getconn)
+        try:
+            yield conn
+        finally:
+            await to_thread.run_sync(release_db_conn, pool, conn)
+
+
+def release_db_conn(pool: ThreadedConnectionPool, conn: connection) -> None:
+    """Return a connection to the pool, discarding uncommitted state."""
+    try:
+        if not conn.closed:
+            conn.rollback()
+    finally:
+        pool.putconn(conn)
+
+
+def db_error_handler(request: Request, exc: Error) -> Response:
+    """Log database errors, without leaking their details to the client."""
+    log.error(f"Database error on {request.url.path}: {exc}")
+    return Response(
+        content={
+            "status_code": HTTP_500_INTERNAL_SERVER_ERROR,
+            "detail": "Database error while splitting AOI",
+        },
+        status_code=HTTP_500_INTERNAL_SERVER_ERROR,
+    )
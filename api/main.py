@@ -18,51 +18,92 @@
 
 from logging import getLogger
 
-from geojson_pydantic import FeatureCollection
-from litestar import Litestar, post
+from litestar import Litestar, MediaType, Request, Response, post
 from litestar.config.compression import CompressionConfig
+from litestar.di import Provide
+from litestar.exceptions import ClientException
 from litestar.logging import LoggingConfig
 from litestar.openapi.config import OpenAPIConfig
 from litestar.openapi.plugins import ScalarRenderPlugin
+from litestar.response import Stream
+from litestar.serialization import encode_json
+from msgspec import to_builtins
+from psycopg2 import Error as DatabaseError
+from psycopg2.extensions import connection
+from shapely.errors import GEOSException
 
-from api.schemas import SplitByAverageBuilding, SplitBySquare
-from api.settings import Settings
+from api.db import (
+    close_db_pool,
+    create_db_pool,
+    db_error_handler,
+    provide_db_conn,
+)
+from api.schemas import FeatureCollection, SplitByAverageBuilding, SplitBySquare
+from api.settings import get_settings
 from fmtm_splitter.splitter import split_by_sql, split_by_square
 
-settings = Settings()
+settings = get_settings()
 log = getLogger(__name__)
 
+# GeoJSON Text Sequence, RFC 8142
+GEOJSON_SEQ = "application/geo+json-seq"
+
+
+def featcol_response(
+    request: Request, featcol: FeatureCollection
+) -> Response[FeatureCollection]:
+    """Return split features, streamed if requested via the Accept header.
+
+    As a GeoJSON Text Sequence each feature is sent as a separate record,
+    so clients can parse features incrementally. The split itself has
+    already finished, with all features in memory, so this changes only
+    the wire format, not server memory or time to first byte.
+    """
+    if request.accept.best_match([MediaType.JSON, GEOJSON_SEQ]) != GEOJSON_SEQ:
+        return Response(featcol, status_code=201)
+
+    features = featcol.get("features") or []
+    return Stream(
+        (b"\x1e" + encode_json(feature) + b"\n" for feature in features),
+        media_type=GEOJSON_SEQ,
+        status_code=201,
+    )
+
 
-@post("/average-building/")
-async def aoi_split_by_average_building(
+@post("/average-building/", sync_to_thread=True)
+def aoi_split_by_average_building(
+    request: Request,
     data: SplitByAverageBuilding,
-) -> FeatureCollection:
+    db: connection,
+) -> Response[FeatureCollection]:
     """Split an AOI by average number of building per task."""
+    aoi = to_builtins(data.aoi)
+    osm_extract = to_builtins(data.osm_extract) if data.osm_extract else None
     try:
         features = split_by_sql(
-            data.aoi.model_dump(),
-            settings.DB_URL,
-            num_buildings=data.num_buildings,
-            osm_extract=data.osm_extract.model_dump() if data.osm_extract else None,
+            aoi, db, num_buildings=data.num_buildings, osm_extract=osm_extract
         )
-        return features
-    except Exception as exc:
-        raise ValueError(f"Failed to split AOI: {str(exc)}") from exc
+    except (ValueError, GEOSException) as exc:
+        raise ClientException(f"Failed to split AOI: {str(exc)}") from exc
+    return featcol_response(request, features)
 
 
-@post("/squares/")
-async def aoi_split_by_square(data: SplitBySquare) -> FeatureCollection:
+@post("/squares/", sync_to_thread=True)
+def aoi_split_by_square(
+    request: Request,
+    data: SplitBySquare,
+    db: connection,
+) -> Response[FeatureCollection]:
     """Split an AOI into squares."""
+    aoi = to_builtins(data.aoi)
+    osm_extract = to_builtins(data.osm_extract) if data.osm_extract else None
     try:
         features = split_by_square(
-            data.aoi.model_dump(),
-            settings.DB_URL,
-            meters=data.dimension,
-            osm_extract=data.osm_extract.model_dump() if data.osm_extract else None,
+            aoi, db, meters=data.dimension, osm_extract=osm_extract
         )
-        return features
-    except Exception as exc:
-        raise ValueError(f"Failed to split AOI: {str(exc)}") from exc
+    except (ValueError, GEOSException) as exc:
+        raise ClientException(f"Failed to split AOI: {str(exc)}") from exc
+    return featcol_response(request, features)
 
 
 app = Litestar(
@@ -71,8 +112,10 @@ app = Litestar(
     # As a microservice, it's likely this is behind a path prefix,
     # but it this could also be set to None if on a subdomain instead
     path="/fmtm-splitter",
-    on_startup=[lambda: print("Starting server.")],
-    on_shutdown=[lambda: print("Stopping server.")],
+    dependencies={"db": Provide(provide_db_conn)},
+    exception_handlers={DatabaseError: db_error_handler},
+    on_startup=[lambda: print("Starting server."), create_db_pool],
+    on_shutdown=[close_db_pool, lambda: print("Stopping server.")],
     logging_config=LoggingConfig(
         root={
             "level": "DEBUG" if settings.DEBUG else "INFO",
@@ -84,7 +127,8 @@ app = Litestar(
             }
         },
     ),
-    compression_config=CompressionConfig(backend="brotli"),
+    # Fast gzip level, as large GeoJSON compresses well regardless
+    compression_config=CompressionConfig(backend="gzip", gzip_compress_level=1),
     openapi_config=OpenAPIConfig(
         title="FMTM Splitter",
         description="A small microservice wrapping the functionality of fmtm-splitter.",
@@ -17,22 +17,52 @@
 """Schemas / dataclasses for input output."""
 
 from dataclasses import dataclass, field
-from typing import Annotated, Optional
+from typing import Annotated, Any, Literal, Optional
 
-from geojson_pydantic import FeatureCollection, Polygon
 from litestar.params import Body
+from msgspec import Struct
 
-from api.settings import Settings
+from api.settings import get_settings
 
-settings = Settings()
+settings = get_settings()
 
 
-def example_aoi_input() -> FeatureCollection | None:
+class Polygon(Struct):
+    """GeoJSON Polygon geometry."""
+
+    type: Literal["Polygon"]
+    coordinates: list[list[list[float]]]
+
+    def __post_init__(self):
+        """Validate linear rings, as in RFC 7946.
+
+        Raised as a msgspec ValidationError while decoding, so returned
+        to the client as a 400.
+        """
+        if not self.coordinates:
+            raise ValueError("Polygon must have at least one linear ring")
+        for ring in self.coordinates:
+            if len(ring) < 4:
+                raise ValueError("Linear ring must have four or more positions")
+            if any(len(position) not in (2, 3) for position in ring):
+                raise ValueError("Position must have two or three coordinates")
+            if ring[0] != ring[-1]:
+                raise ValueError("Linear ring must start and end at the same position")
+
+
+class FeatureCollection(Struct):
+    """GeoJSON FeatureCollection, features are passed through as dicts."""
+
+    type: Literal["FeatureCollection"]
+    features: list[dict[str, Any]]
+
+
+def example_aoi_input() -> Polygon | None:
     """Provide example AOI input for debugging."""
     if settings.DEBUG:
-        return {
-            "type": "Polygon",
-            "coordinates": [
+        return Polygon(
+            type="Polygon",
+            coordinates=[
                 [
                     [85.29998911024427, 27.714008043780694],
                     [85.29998911024427, 27.710892349952076],
@@ -41,17 +71,21 @@ def example_aoi_input() -> FeatureCollection | None:
                     [85.29998911024427, 27.714008043780694],
                 ]
             ],
-        }
+        )
     return None
 
 
+# Built once, as the default for every request without an AOI
+EXAMPLE_AOI = example_aoi_input()
+
+
 @dataclass
 class AoiInput:
     """Input AOI Polygon GeoJSON."""
 
     aoi: Annotated[
         Polygon, Body(title="Upload AOI", description="Upload a GeoJSON Polygon.")
-    ] = field(default_factory=example_aoi_input)
+    ] = field(default_factory=lambda: EXAMPLE_AOI)
 
 
 @dataclass
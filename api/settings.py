@@ -18,6 +18,7 @@
 
 import os
 from dataclasses import dataclass, field
+from functools import lru_cache
 
 
 def parse_bool(value: str) -> bool:
@@ -25,7 +26,7 @@ def parse_bool(value: str) -> bool:
     return value.lower() in {"1", "true", "yes"} if value else False
 
 
-@dataclass
+@dataclass(frozen=True)
 class Settings:
     """The LiteStar application settings."""
 
@@ -35,3 +36,13 @@ class Settings:
             "DB_URL", "postgresql://fmtm:dummycipassword@db/splitter"
         )
     )
+    DB_POOL_MIN: int = field(default_factory=lambda: int(os.getenv("DB_POOL_MIN", "4")))
+    DB_POOL_MAX: int = field(
+        default_factory=lambda: int(os.getenv("DB_POOL_MAX", "20"))
+    )
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Get the settings, parsed from env vars once per process."""
+    return Settings()
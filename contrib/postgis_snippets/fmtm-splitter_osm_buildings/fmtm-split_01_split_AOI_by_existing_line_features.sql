@@ -92,7 +92,7 @@ SELECT POPULATE_GEOMETRY_COLUMNS('public.polygonsnocount'::regclass);
 -- Add a spatial index (vastly improves performance for a lot of operations)
 CREATE INDEX polygonsnocount_idx
 ON polygonsnocount
-USING gist (geom);
+USING {%indextype%} (geom);
 -- Clean up the table which may have gaps and stuff from spatial indexing
 
 -- For use with psycopg2, vaccum analyze needs to happen after commit
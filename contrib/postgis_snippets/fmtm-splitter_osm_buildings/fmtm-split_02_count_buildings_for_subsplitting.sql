@@ -33,7 +33,7 @@ SELECT Populate_Geometry_Columns('public.buildings'::regclass);
 -- Add a spatial index (vastly improves performance for a lot of operations)
 CREATE INDEX buildings_idx
   ON buildings
-  USING GIST (geom);
+  USING {%indextype%} (geom);
 -- Clean up the table which may have gaps and stuff from spatial indexing
 
 --VACUUM ANALYZE buildings;
@@ -58,7 +58,7 @@ ALTER TABLE splitpolygons ADD PRIMARY KEY(polyid);
 SELECT Populate_Geometry_Columns('public.splitpolygons'::regclass);
 CREATE INDEX splitpolygons_idx
   ON splitpolygons
-  USING GIST (geom);
+  USING {%indextype%} (geom);
 
 --VACUUM ANALYZE splitpolygons;
 
@@ -101,7 +101,7 @@ ALTER TABLE lowfeaturecountpolygons ADD PRIMARY KEY(polyid);
 SELECT Populate_Geometry_Columns('public.lowfeaturecountpolygons'::regclass);
 CREATE INDEX lowfeaturecountpolygons_idx
   ON lowfeaturecountpolygons
-  USING GIST (geom);
+  USING {%indextype%} (geom);
 
 --VACUUM ANALYZE lowfeaturecountpolygons;
 
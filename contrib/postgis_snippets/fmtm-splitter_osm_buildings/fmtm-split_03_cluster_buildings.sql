@@ -59,7 +59,7 @@ ALTER TABLE clusteredbuildings ADD PRIMARY KEY(osm_id);
 SELECT Populate_Geometry_Columns('public.clusteredbuildings'::regclass);
 CREATE INDEX clusteredbuildings_idx
   ON clusteredbuildings
-  USING GIST (geom);
+  USING {%indextype%} (geom);
 
 --VACUUM ANALYZE clusteredbuildings;
 
@@ -35,7 +35,7 @@ CREATE TABLE dumpedpoints AS (
 SELECT populate_geometry_columns('public.dumpedpoints'::regclass);
 CREATE INDEX dumpedpoints_idx
 ON dumpedpoints
-USING gist (geom);
+USING {%indextype%} (geom);
 
 --VACUUM ANALYZE dumpedpoints;
 
@@ -54,7 +54,7 @@ CREATE TABLE voronoids AS (
 );
 CREATE INDEX voronoids_idx
 ON voronoids
-USING gist (geom);
+USING {%indextype%} (geom);
 
 --VACUUM ANALYZE voronoids;
 
@@ -69,7 +69,7 @@ CREATE TABLE voronois AS (
 );
 CREATE INDEX voronois_idx
 ON voronois
-USING gist (geom);
+USING {%indextype%} (geom);
 
 --VACUUM ANALYZE voronois;
 
@@ -84,7 +84,7 @@ CREATE TABLE unsimplifiedtaskpolygons AS (
 );
 CREATE INDEX unsimplifiedtaskpolygons_idx
 ON unsimplifiedtaskpolygons
-USING gist (geom);
+USING {%indextype%} (geom);
 
 --VACUUM ANALYZE unsimplifiedtaskpolygons;
 
@@ -136,7 +136,7 @@ ALTER TABLE taskpolygons ADD PRIMARY KEY (taskid);
 SELECT populate_geometry_columns('public.taskpolygons'::regclass);
 CREATE INDEX taskpolygons_idx
 ON taskpolygons
-USING gist (geom);
+USING {%indextype%} (geom);
 
 --VACUUM ANALYZE taskpolygons;
 
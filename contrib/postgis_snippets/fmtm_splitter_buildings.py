@@ -18,47 +18,89 @@
 """Test util to split by various SQL algorithms."""
 
 import argparse
+import json
 import logging
 import os
+import re
 import sys
+from pathlib import Path
 from sys import argv
 
 import psycopg2
-from osgeo import gdal
 
 # Instantiate logger
 log = logging.getLogger(__name__)
 
+# The modular splitting steps, read once on import.
+# Each step reads the tables written by the previous one
+# (polygonsnocount -> buildings, splitpolygons -> clusteredbuildings
+# -> taskpolygons), so they must run sequentially on one connection.
+MODULAR_SQL_DIR = os.path.join(os.path.dirname(__file__), "fmtm-splitter_osm_buildings")
+MODULAR_SQL_FILES = (
+    "fmtm-split_01_split_AOI_by_existing_line_features.sql",
+    "fmtm-split_02_count_buildings_for_subsplitting.sql",
+    "fmtm-split_03_cluster_buildings.sql",
+    "fmtm-split_04_create_polygons_around_clustered_buildings.sql",
+    "fmtm-split_05_clean_temp_files.sql",
+)
+MODULAR_SQL_TEMPLATES: tuple[str, ...] = tuple(
+    Path(MODULAR_SQL_DIR, sqlfile).read_text() for sqlfile in MODULAR_SQL_FILES
+)
+# All steps as one script, as they are always run together
+MODULAR_SQL_TEMPLATE = "\n".join(MODULAR_SQL_TEMPLATES)
+# Placeholders in the SQL look like {%numfeatures%}
+SQL_PLACEHOLDER = re.compile(r"\{%(\w+)%\}")
+
+
+def render_modular_sql(**params) -> str:
+    """Fill in the modular SQL placeholders in a single pass."""
+    return SQL_PLACEHOLDER.sub(
+        lambda match: str(params[match.group(1)]), MODULAR_SQL_TEMPLATE
+    )
+
 
 def split_by_buildings(
     aoi: str,  # GeoJSON polygon input file
     queries: list,  # list of SQL queries
     dbd: list,  # database host, dbname, user, password
+    index_type: str = "SPGIST",  # spatial index access method, GIST or SPGIST
 ):
     """Split the polygon by buildings in the database using an SQL query."""
-    dbstring = f"PG:host={dbd[0]} dbname={dbd[1]} " f"user={dbd[2]} password={dbd[3]}"
     dbshell = psycopg2.connect(
         host=dbd[0], database=dbd[1], user=dbd[2], password=dbd[3]
     )
-    dbshell.autocommit = True
     dbcursor = dbshell.cursor()
-    dbcursor.execute("DROP TABLE IF EXISTS aoi;")
-    # Add the AOI to the database
-    log.info(f"Writing {aoi} to database as aoi layer.")
-    gdal.VectorTranslate(dbstring, aoi, layerName="aoi")
+
+    with open(aoi, "r") as jsonfile:
+        aoi_geojson = json.load(jsonfile)
+    if aoi_geojson.get("type") == "FeatureCollection":
+        aoi_geojson = aoi_geojson["features"][0]
+    if aoi_geojson.get("type") == "Feature":
+        aoi_geojson = aoi_geojson["geometry"]
+
+    # Add the AOI to the database, on this connection only.
+    # TEMP tables are not WAL-logged, and this one is dropped on commit.
+    log.info(f"Writing {aoi} to database as project_aoi layer.")
+    dbcursor.execute(
+        "CREATE TEMP TABLE project_aoi ("
+        "fid SERIAL PRIMARY KEY, geom GEOMETRY(GEOMETRY, 4326)"
+        ") ON COMMIT DROP;"
+    )
+    dbcursor.execute(
+        "INSERT INTO project_aoi (geom) "
+        "VALUES (ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326));",
+        (json.dumps(aoi_geojson),),
+    )
     dbcursor.execute(
-        "DROP TABLE IF EXISTS project_aoi;"
-        "CREATE TABLE project_aoi AS (SELECT "
-        "ogc_fid as fid,wkb_geometry AS geom FROM aoi);"
-        "ALTER TABLE project_aoi ADD PRIMARY KEY(fid);"
-        "CREATE INDEX project_aoi_idx "
-        "ON project_aoi USING GIST (geom);"
-        "DROP TABLE aoi;"
+        f"CREATE INDEX project_aoi_idx ON project_aoi USING {index_type} (geom);"
     )
-    dbcursor.execute("VACUUM ANALYZE")
-    for query in queries:
-        dbcursor.execute(query)
-        dbcursor.execute("VACUUM ANALYZE")
+    # Run all steps in one round trip, committed atomically.
+    # The new tables need statistics only, not a full VACUUM of the db,
+    # and ANALYZE (unlike VACUUM) is allowed inside the transaction.
+    dbcursor.execute(
+        "\n".join(["ANALYZE project_aoi;", *queries, "ANALYZE taskpolygons;"])
+    )
+    dbshell.commit()
     log.info("Might very well have completed successfully")
 
 
@@ -80,6 +122,13 @@ if __name__ == "__main__":
         default=20,
         help="Number of features on average desired per task",
     )
+    p.add_argument(
+        "-i",
+        "--indextype",
+        default="SPGIST",
+        choices=["GIST", "SPGIST"],
+        help="Spatial index type for the generated tables",
+    )
     p.add_argument("-v", "--verbose", action="store_true", help="verbose output")
     p.add_argument(
         "-o", "--outfile", default="fmtm.geojson", help="Output file from splitting"
@@ -114,19 +163,8 @@ if __name__ == "__main__":
 
     # Read in the project AOI, a GeoJSON file containing a polygon
     aoi = args.boundary
-    modulardir = os.path.join(os.path.dirname(__file__), "fmtm-splitter_osm_buildings")
-    modularsqlfiles = [
-        "fmtm-split_01_split_AOI_by_existing_line_features.sql",
-        "fmtm-split_02_count_buildings_for_subsplitting.sql",
-        "fmtm-split_03_cluster_buildings.sql",
-        "fmtm-split_04_create_polygons_around_clustered_buildings.sql",
-        "fmtm-split_05_clean_temp_files.sql",
+    modularqueries = [
+        render_modular_sql(numfeatures=args.numfeatures, indextype=args.indextype)
     ]
-    modularqueries = []
-    for sqlfile in modularsqlfiles:
-        with open(os.path.join(modulardir, sqlfile), "r") as sql:
-            modularqueries.append(
-                sql.read().replace("{%numfeatures%}", str(args.numfeatures))
-            )
     dbdetails = [args.host, args.database, args.user, args.password]
-    features = split_by_buildings(aoi, modularqueries, dbdetails)
+    features = split_by_buildings(aoi, modularqueries, dbdetails, args.indextype)
@@ -16,19 +16,139 @@
 #
 """DB models for temporary tables in splitBySQL."""
 
+import json
 import logging
-from typing import Union
+import struct
+from functools import cache
+from itertools import chain, islice
+from typing import Iterable, Optional, Union
 
 import psycopg2
 from psycopg2.extensions import register_adapter
-from psycopg2.extras import Json, register_uuid
+from psycopg2.extras import Json, execute_values, register_uuid
 from shapely.geometry import Polygon
 
 log = logging.getLogger(__name__)
 
+# Tables created while splitting, dropped together in a single statement.
+# All are TEMP tables, private to the session, so concurrent splits on
+# separate connections never block on each other's DROP or CREATE
+SPLIT_TABLES = (
+    "buildings",
+    "clusteredbuildings",
+    "dumpedpoints",
+    "leastfeaturepolygons",
+    "lowfeaturecountpolygons",
+    "voronois",
+    "taskpolygons",
+    "unsimplifiedtaskpolygons",
+    "splitpolygons",
+    "project_aoi",
+    "aoi_parts",
+    "ways_poly",
+    "ways_line",
+)
+
+# Framing for COPY in binary format, with three fields per row
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_BINARY_TRAILER = struct.pack("!h", -1)
+COPY_FIELD_COUNT = struct.pack("!h", 3)
+COPY_NULL = struct.pack("!i", -1)
+
+# Qualified with pg_temp, so tables of the same name in other schemas,
+# such as an osm2pgsql import, are never dropped
+DROP_TABLES_SQL = (
+    "DROP VIEW IF EXISTS pg_temp.lines_view; "
+    "DROP TABLE IF EXISTS "
+    f"{', '.join(f'pg_temp.{table}' for table in SPLIT_TABLES)} CASCADE;"
+)
+
+# Scratch tables, loaded once then read. TEMP tables skip the WAL, as
+# UNLOGGED did, and are never vacuumed, so are analyzed explicitly
+CREATE_TABLES_SQL = """
+    CREATE TEMP TABLE project_aoi (
+        id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+        geom GEOMETRY(GEOMETRY, 4326)
+    );
+
+    CREATE TEMP TABLE ways_poly (
+        id SERIAL PRIMARY KEY,
+        osm_id VARCHAR,
+        geom GEOMETRY(GEOMETRY, 4326),
+        tags JSONB
+    );
+
+    CREATE TEMP TABLE ways_line (
+        id SERIAL PRIMARY KEY,
+        osm_id VARCHAR,
+        geom GEOMETRY(GEOMETRY, 4326),
+        tags JSONB
+    );
+"""
+
+AOI_INSERT_SQL = """
+    INSERT INTO project_aoi (geom)
+    VALUES (ST_GeomFromWKB(%s, 4326));
+"""
+
+# Polylines intersecting the AOI, only created for custom splitting
+# algorithms that query lines_view, as fmtm_algorithm.sql does not.
+# The AOI is stored as indexed parts of at most 255 vertices, so the join
+# probes the ways_line index once per small part, not with one large bbox
+LINES_VIEW_SQL = """
+    CREATE TEMP TABLE aoi_parts AS
+    SELECT ST_Subdivide(geom, 255) AS geom FROM project_aoi;
+    CREATE INDEX aoi_parts_idx ON aoi_parts USING GIST (geom);
+    ANALYZE aoi_parts;
+
+    CREATE TEMP VIEW lines_view AS
+    SELECT DISTINCT ON (l.id) l.tags, l.geom
+    FROM aoi_parts AS a
+    INNER JOIN ways_line AS l ON ST_Intersects(a.geom, l.geom);
+"""
+
+# Opt-in session settings for splitting, as a short-lived bulk load and
+# analysis. Split tables are scratch data, so commits need not wait for the
+# WAL flush. Memory is per sort or hash, so kept modest for shared servers
+BULK_SESSION_SETTINGS = {
+    "synchronous_commit": "off",
+    "work_mem": "64MB",
+    "maintenance_work_mem": "256MB",
+    # Split tables are TEMP, so held in session-local buffers
+    "temp_buffers": "64MB",
+    "jit": "off",
+}
+
+# Rows per INSERT statement, beyond which COPY is used for bulk loads
+INSERT_PAGE_SIZE = 1000
+
+# Bytes of binary COPY data sent to the server per read
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+@cache
+def register_adapters() -> None:
+    """Register global psycopg2 adapters, once per process."""
+    # Makes Postgres UUID, JSONB usable, else error
+    register_uuid()
+    register_adapter(dict, Json)
+
+
+def session_options(session_settings: dict[str, str]) -> str:
+    """Format Postgres settings as libpq startup options.
+
+    Args:
+        session_settings (dict): Postgres settings, e.g. BULK_SESSION_SETTINGS.
+
+    Returns:
+        str: The value for the `options` connection parameter.
+    """
+    return " ".join(f"-c {k}={v}" for k, v in session_settings.items())
+
 
 def create_connection(
     db: Union[str, psycopg2.extensions.connection],
+    session_settings: Optional[dict[str, str]] = None,
 ) -> psycopg2.extensions.connection:
     """Get db connection from existing psycopg2 connection, or URL string.
 
@@ -37,18 +157,22 @@ def create_connection(
             string or existing db connection.
             If `db` is a string, a new connection is generated.
             If `db` is a psycopg2 connection, the connection is re-used.
+        session_settings (dict): Postgres settings for a new connection,
+            e.g. BULK_SESSION_SETTINGS. Sent as startup options, so cost no
+            extra round trip. Existing connections are left as they are.
 
     Returns:
         conn: DBAPI connection object to generate cursors from.
     """
-    # Makes Postgres UUID, JSONB usable, else error
-    register_uuid()
-    register_adapter(dict, Json)
+    register_adapters()
 
     if isinstance(db, psycopg2.extensions.connection):
         conn = db
     elif isinstance(db, str):
-        conn = psycopg2.connect(db)
+        if session_settings:
+            conn = psycopg2.connect(db, options=session_options(session_settings))
+        else:
+            conn = psycopg2.connect(db)
     else:
         msg = "The `db` variable is not a valid string or psycopg2 connection."
         log.error(msg)
@@ -72,36 +196,60 @@ def close_connection(conn: psycopg2.extensions.connection):
 def create_tables(conn: psycopg2.extensions.connection):
     """Create tables required for splitting.
 
+    Existing tables are dropped first, in the same command.
+
     Uses a new cursor on existing connection, but not committed directly.
     """
-    # First drop tables if they exist
-    drop_tables(conn)
-
-    create_cmd = """
-        CREATE TABLE project_aoi (
-            id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
-            geom GEOMETRY(GEOMETRY, 4326)
-        );
-
-        CREATE TABLE ways_poly (
-            id SERIAL PRIMARY KEY,
-            osm_id VARCHAR,
-            geom GEOMETRY(GEOMETRY, 4326),
-            tags JSONB
-        );
-
-        CREATE TABLE ways_line (
-            id SERIAL PRIMARY KEY,
-            osm_id VARCHAR,
-            geom GEOMETRY(GEOMETRY, 4326),
-            tags JSONB
-        );
-    """
     log.debug(
-        "Running tables create command for 'project_aoi', 'ways_poly', 'ways_line'"
+        "Running tables drop and create command for "
+        "'project_aoi', 'ways_poly', 'ways_line'"
     )
     cur = conn.cursor()
-    cur.execute(create_cmd)
+    cur.execute(DROP_TABLES_SQL + CREATE_TABLES_SQL)
+
+
+def setup_tables(
+    conn: psycopg2.extensions.connection, geom: Polygon, lines_view: bool = False
+):
+    """Recreate the split tables and insert the AOI.
+
+    Equivalent to `create_tables` then `aoi_to_postgis`, but sent as a
+    single multi-statement command, in one round trip.
+
+    Uses a new cursor on existing connection, but not committed directly.
+
+    Args:
+        conn (psycopg2.extensions.connection): The PostgreSQL connection.
+        geom (Polygon): The shapely AOI geom to insert.
+        lines_view (bool): Also create lines_view, with the AOI subdivided
+            into the indexed aoi_parts table that it joins against.
+    """
+    log.debug(f"Recreating split tables, with AOI (lines_view: {lines_view})")
+    sql = DROP_TABLES_SQL + CREATE_TABLES_SQL + AOI_INSERT_SQL
+    if lines_view:
+        sql += LINES_VIEW_SQL
+    cur = conn.cursor()
+    cur.execute(sql, (psycopg2.Binary(geom.wkb),))
+
+
+def create_indexes(conn: psycopg2.extensions.connection):
+    """Create spatial indexes on the data extract tables, then analyze them.
+
+    Called after the extract is loaded, as building an index once is
+    cheaper than updating it for every inserted row. The planner then has
+    real statistics for the splitting queries, with autovacuum disabled.
+
+    Uses a new cursor on existing connection, but not committed directly.
+    """
+    index_cmd = """
+        -- SP-GiST builds faster and is smaller than GiST for dense OSM data
+        CREATE INDEX ways_poly_idx ON ways_poly USING SPGIST (geom);
+        CREATE INDEX ways_line_idx ON ways_line USING SPGIST (geom);
+        ANALYZE project_aoi, ways_poly, ways_line;
+    """
+    log.debug("Running index create and analyze for 'ways_poly', 'ways_line'")
+    cur = conn.cursor()
+    cur.execute(index_cmd)
 
 
 def drop_tables(conn: psycopg2.extensions.connection):
@@ -109,32 +257,21 @@ def drop_tables(conn: psycopg2.extensions.connection):
 
     Uses a new cursor on existing connection, but not committed directly.
     """
-    drop_cmd = (
-        "DROP VIEW IF EXISTS lines_view;"
-        "DROP TABLE IF EXISTS buildings CASCADE; "
-        "DROP TABLE IF EXISTS clusteredbuildings CASCADE; "
-        "DROP TABLE IF EXISTS dumpedpoints CASCADE; "
-        "DROP TABLE IF EXISTS lowfeaturecountpolygons CASCADE; "
-        "DROP TABLE IF EXISTS voronois CASCADE; "
-        "DROP TABLE IF EXISTS taskpolygons CASCADE; "
-        "DROP TABLE IF EXISTS unsimplifiedtaskpolygons CASCADE; "
-        "DROP TABLE IF EXISTS splitpolygons CASCADE; "
-        "DROP TABLE IF EXISTS project_aoi CASCADE; "
-        "DROP TABLE IF EXISTS ways_poly CASCADE; "
-        "DROP TABLE IF EXISTS ways_line CASCADE;"
-    )
-    log.debug(f"Running tables drop command: {drop_cmd}")
+    log.debug(f"Running tables drop command: {DROP_TABLES_SQL}")
     cur = conn.cursor()
-    cur.execute(drop_cmd)
+    cur.execute(DROP_TABLES_SQL)
 
 
-def aoi_to_postgis(conn: psycopg2.extensions.connection, geom: Polygon) -> None:
+def aoi_to_postgis(
+    conn: psycopg2.extensions.connection, geom: Union[Polygon, dict]
+) -> None:
     """Export a GeoDataFrame to the project_aoi table in PostGIS.
 
     Uses a new cursor on existing connection, but not committed directly.
 
     Args:
-        geom (Polygon): The shapely geom to insert.
+        geom (Polygon, dict): The shapely geom, or GeoJSON geometry, to insert.
+            GeoJSON is parsed by PostGIS, without a shapely round trip.
         conn (psycopg2.extensions.connection): The PostgreSQL connection.
 
     Returns:
@@ -142,31 +279,184 @@ def aoi_to_postgis(conn: psycopg2.extensions.connection, geom: Polygon) -> None:
     """
     log.debug("Adding AOI to project_aoi table")
 
-    sql = """
-        INSERT INTO project_aoi (geom)
-        VALUES (ST_SetSRID(CAST(%s AS GEOMETRY), 4326));
-    """
+    if isinstance(geom, dict):
+        sql = """
+            INSERT INTO project_aoi (geom)
+            VALUES (ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326));
+        """
+        params = (json.dumps(geom),)
+    else:
+        sql = AOI_INSERT_SQL
+        params = (psycopg2.Binary(geom.wkb),)
 
     cur = conn.cursor()
-    cur.execute(sql, (geom.wkb_hex,))
+    cur.execute(sql, params)
     cur.close()
 
 
 def insert_geom(cur: psycopg2.extensions.cursor, table_name: str, **kwargs) -> None:
     """Insert an OSM geometry into the database.
 
+    Kept for compatibility, as a single row `insert_geoms` call.
+    Prefer `load_geoms` for more than a few rows.
     Does not commit the values automatically.
 
     Args:
         cur (psycopg2.extensions.cursor): The PostgreSQL cursor.
         table_name (str): The name of the table to insert data into.
-        **kwargs: Keyword arguments representing the values to be inserted.
+        **kwargs: Keyword arguments representing the values to be inserted:
+            osm_id, geom as WKB (bytes or hex string), tags (dict or JSON).
 
     Returns:
         None
     """
-    query = (
-        f"INSERT INTO {table_name}(geom,osm_id,tags) "
-        "VALUES (%(geom)s,%(osm_id)s,%(tags)s)"
+    geom = kwargs["geom"]
+    if isinstance(geom, str):
+        geom = bytes.fromhex(geom)
+    tags = kwargs.get("tags") or {}
+    if not isinstance(tags, str):
+        tags = json.dumps(tags)
+    insert_geoms(cur, table_name, [(kwargs.get("osm_id"), bytes(geom), tags)])
+
+
+def insert_geoms(
+    cur: psycopg2.extensions.cursor,
+    table_name: str,
+    rows: list[tuple[Optional[str], bytes, str]],
+) -> None:
+    """Insert a batch of OSM geometries as multi-row INSERT statements.
+
+    Does not commit the values automatically.
+
+    Args:
+        cur (psycopg2.extensions.cursor): The PostgreSQL cursor.
+        table_name (str): The name of the table to insert data into.
+        rows (list[tuple]): (osm_id, geom as WKB, tags as JSON text)
+            per row.
+
+    Returns:
+        None
+    """
+    execute_values(
+        cur,
+        f"INSERT INTO {table_name} (osm_id, geom, tags) VALUES %s",
+        rows,
+        template="(%s, ST_GeomFromWKB(%s, 4326), %s::jsonb)",
+        page_size=INSERT_PAGE_SIZE,
     )
-    cur.execute(query, kwargs)
+
+
+class BinaryCopyReader:
+    """File-like object, encoding rows in binary COPY format as they are read.
+
+    Only rows for the requested chunk are pulled from the iterable, so the
+    COPY payload is never held in memory all at once.
+    """
+
+    def __init__(self, rows: Iterable[tuple[Optional[str], bytes, str]]):
+        """Wrap the rows to encode, between the COPY header and trailer.
+
+        Args:
+            rows (Iterable[tuple]): (osm_id, geom as WKB, tags as JSON text)
+                per row.
+        """
+        self._chunks = chain(
+            (COPY_BINARY_HEADER,),
+            map(self.encode_row, rows),
+            (COPY_BINARY_TRAILER,),
+        )
+        self._buffer = bytearray()
+
+    @staticmethod
+    def encode_row(row: tuple[Optional[str], bytes, str]) -> bytes:
+        """Encode a single row, with three length-prefixed fields."""
+        osm_id, geom, tags = row
+        if osm_id is None:
+            osm_id_field = COPY_NULL
+        else:
+            osm_id = str(osm_id).encode()
+            osm_id_field = struct.pack("!i", len(osm_id)) + osm_id
+        # Binary JSONB is a version byte followed by the JSON text
+        tags = b"\x01" + tags.encode()
+        return b"".join(
+            (
+                COPY_FIELD_COUNT,
+                osm_id_field,
+                # The geometry type accepts WKB directly in binary format
+                struct.pack("!i", len(geom)),
+                geom,
+                struct.pack("!i", len(tags)),
+                tags,
+            )
+        )
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to `size` bytes, or everything remaining if negative."""
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def copy_geoms(
+    cur: psycopg2.extensions.cursor,
+    table_name: str,
+    rows: Iterable[tuple[Optional[str], bytes, str]],
+) -> None:
+    """Bulk load OSM geometries into the database using COPY.
+
+    Streams every row in one COPY, rather than as INSERT statements.
+    Rows are encoded and sent in chunks of COPY_CHUNK_SIZE bytes, so memory
+    is bounded by the chunk size, not the number of rows.
+    Does not commit the values automatically.
+
+    Args:
+        cur (psycopg2.extensions.cursor): The PostgreSQL cursor.
+        table_name (str): The name of the table to insert data into.
+        rows (Iterable[tuple]): (osm_id, geom as WKB, tags as JSON text)
+            per row.
+
+    Returns:
+        None
+    """
+    cur.copy_expert(
+        f"COPY {table_name} (osm_id, geom, tags) FROM STDIN WITH (FORMAT binary)",
+        BinaryCopyReader(rows),
+        size=COPY_CHUNK_SIZE,
+    )
+
+
+def load_geoms(
+    cur: psycopg2.extensions.cursor,
+    table_name: str,
+    rows: Iterable[tuple[Optional[str], bytes, str]],
+) -> None:
+    """Load OSM geometries, with INSERT for small batches else COPY.
+
+    Rows are consumed lazily, so may be passed as a generator.
+    Does not commit the values automatically.
+
+    Args:
+        cur (psycopg2.extensions.cursor): The PostgreSQL cursor.
+        table_name (str): The name of the table to insert data into.
+        rows (Iterable[tuple]): (osm_id, geom as WKB, tags as JSON text)
+            per row.
+
+    Returns:
+        None
+    """
+    rows = iter(rows)
+    # Peek one row past a single page, to pick the load method
+    first_page = list(islice(rows, INSERT_PAGE_SIZE + 1))
+    if not first_page:
+        return
+    if len(first_page) <= INSERT_PAGE_SIZE:
+        insert_geoms(cur, table_name, first_page)
+    else:
+        copy_geoms(cur, table_name, chain(first_page, rows))
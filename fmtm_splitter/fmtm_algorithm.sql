@@ -1,4 +1,4 @@
-DROP TABLE IF EXISTS polygonsnocount;
+DROP TABLE IF EXISTS pg_temp.polygonsnocount;
 -- Create a new polygon layer of splits by lines
 
 DO $$
@@ -15,7 +15,7 @@ BEGIN
         OR l.tags->>'railway' IS NOT NULL
     );
     IF lines_count > 0 THEN
-    CREATE TABLE polygonsnocount AS (
+    CREATE TEMP TABLE polygonsnocount AS (
         -- The Area of Interest provided by the person creating the project
         WITH aoi AS (
             SELECT * FROM "project_aoi"
@@ -81,7 +81,7 @@ BEGIN
     );
     ELSE
         -- Calculate number of buildings per cluster
-        CREATE TABLE polygonsnocount AS (
+        CREATE TEMP TABLE polygonsnocount AS (
             WITH aoi AS (
                 SELECT * FROM "project_aoi"
             )
@@ -110,8 +110,8 @@ USING gist (geom);
 -- VACUUM ANALYZE polygonsnocount;
 
 
-DROP TABLE IF EXISTS buildings;
-CREATE TABLE buildings AS (
+DROP TABLE IF EXISTS pg_temp.buildings;
+CREATE TEMP TABLE buildings AS (
     SELECT
         b.*,
         polys.polyid
@@ -134,8 +134,8 @@ USING gist (geom);
 -- Clean up the table which may have gaps and stuff from spatial indexing
 -- VACUUM ANALYZE buildings;
 
-DROP TABLE IF EXISTS splitpolygons;
-CREATE TABLE splitpolygons AS (
+DROP TABLE IF EXISTS pg_temp.splitpolygons;
+CREATE TEMP TABLE splitpolygons AS (
     WITH polygonsfeaturecount AS (
         SELECT
             sp.polyid,
@@ -158,7 +158,7 @@ ON splitpolygons
 USING gist (geom);
 -- VACUUM ANALYZE splitpolygons;
 
-DROP TABLE polygonsnocount;
+DROP TABLE pg_temp.polygonsnocount;
 
 
 -- DROP TABLE IF EXISTS lowfeaturecountpolygons;
@@ -207,8 +207,8 @@ DROP TABLE polygonsnocount;
 -- VACUUM ANALYZE lowfeaturecountpolygons;
 
 
-DROP TABLE IF EXISTS clusteredbuildings;
-CREATE TABLE clusteredbuildings AS (
+DROP TABLE IF EXISTS pg_temp.clusteredbuildings;
+CREATE TEMP TABLE clusteredbuildings AS (
     WITH splitpolygonswithcontents AS (
         SELECT *
         FROM splitpolygons AS sp
@@ -268,8 +268,8 @@ USING gist (geom);
 -- VACUUM ANALYZE clusteredbuildings;
 
 
-DROP TABLE IF EXISTS dumpedpoints;
-CREATE TABLE dumpedpoints AS (
+DROP TABLE IF EXISTS pg_temp.dumpedpoints;
+CREATE TEMP TABLE dumpedpoints AS (
     SELECT
         cb.osm_id,
         cb.polyid,
@@ -287,8 +287,8 @@ ON dumpedpoints
 USING gist (geom);
 -- VACUUM ANALYZE dumpedpoints;
 
-DROP TABLE IF EXISTS voronoids;
-CREATE TABLE voronoids AS (
+DROP TABLE IF EXISTS pg_temp.voronoids;
+CREATE TEMP TABLE voronoids AS (
     SELECT
         ST_INTERSECTION((ST_DUMP(ST_VORONOIPOLYGONS(
             ST_COLLECT(points.geom)
@@ -304,8 +304,8 @@ ON voronoids
 USING gist (geom);
 -- VACUUM ANALYZE voronoids;
 
-DROP TABLE IF EXISTS voronois;
-CREATE TABLE voronois AS (
+DROP TABLE IF EXISTS pg_temp.voronois;
+CREATE TEMP TABLE voronois AS (
     SELECT
         p.clusteruid,
         v.geom
@@ -316,10 +316,10 @@ CREATE INDEX voronois_idx
 ON voronois
 USING gist (geom);
 -- VACUUM ANALYZE voronois;
-DROP TABLE voronoids;
+DROP TABLE pg_temp.voronoids;
 
-DROP TABLE IF EXISTS unsimplifiedtaskpolygons;
-CREATE TABLE unsimplifiedtaskpolygons AS (
+DROP TABLE IF EXISTS pg_temp.unsimplifiedtaskpolygons;
+CREATE TEMP TABLE unsimplifiedtaskpolygons AS (
     SELECT
         clusteruid,
         ST_UNION(geom) AS geom
@@ -335,8 +335,8 @@ USING gist (geom);
 
 --*****************************Simplify*******************************
 -- Extract unique line segments
-DROP TABLE IF EXISTS taskpolygons;
-CREATE TABLE taskpolygons AS (
+DROP TABLE IF EXISTS pg_temp.taskpolygons;
+CREATE TEMP TABLE taskpolygons AS (
     --Convert task polygon boundaries to linestrings
     WITH rawlines AS (
         SELECT
@@ -406,8 +406,8 @@ BEGIN
     -- Set the threshold as mean - standard deviation
     min_area := mean_area - stddev_area;
 
-    DROP TABLE IF EXISTS leastfeaturepolygons;
-    CREATE TABLE leastfeaturepolygons AS
+    DROP TABLE IF EXISTS pg_temp.leastfeaturepolygons;
+    CREATE TEMP TABLE leastfeaturepolygons AS
     SELECT taskid, geom
     FROM taskpolygons
     WHERE ST_Area(geom) < min_area OR (
@@ -440,7 +440,7 @@ BEGIN
     END LOOP;
 END $$;
 
-DROP TABLE IF EXISTS leastfeaturepolygons;
+DROP TABLE IF EXISTS pg_temp.leastfeaturepolygons;
 -- VACUUM ANALYZE taskpolygons;
 
 -- Generate GeoJSON output
@@ -3,60 +3,103 @@
 """Utils to split using Overpass API."""
 
 import argparse
+import errno
 import os
+import shutil
 import subprocess
+import sys
+import tempfile
+import time
 from datetime import datetime
 
 import requests
-from osgeo import ogr
+import shapely
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError
+
+# Reuse connections to the Overpass API across queries
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+# Seconds to wait to connect, then between bytes of a (slow) query response
+OVERPASS_TIMEOUT = (10, 300)
 
 
 def aoiextent(aoifile):
     """Accept a GeoJSON file, return its extent as a bbox string."""
-    indriver = ogr.GetDriverByName("GeoJSON")
-    indata = indriver.Open(aoifile)
-    inlayer = indata.GetLayer()
-    e = list(inlayer.GetExtent())
-    bboxstring = f"{e[2]},{e[0]},{e[3]},{e[1]}"
+    # A FeatureCollection is read as a single GeometryCollection
+    with open(aoifile) as jsonfile:
+        minx, miny, maxx, maxy = shapely.from_geojson(jsonfile.read()).bounds
+    bboxstring = f"{miny},{minx},{maxy},{maxx}"
     return bboxstring
 
 
-def query(query_string, overpass_url):
-    """Accept a query in Overpass API query language, return an osm dataset."""
+def query(query_string, overpass_url, outfile):
+    """Accept a query in Overpass API query language, write an osm dataset.
+
+    The response is streamed to `outfile` without being held in memory.
+
+    Returns:
+        str: the path written to, or None if the query failed.
+    """
     try:
-        response = requests.get(overpass_url, params={"data": query_string})
+        response = session.get(
+            overpass_url,
+            params={"data": query_string},
+            stream=True,
+            timeout=OVERPASS_TIMEOUT,
+        )
     except Exception:
         print("overpass did not want to answer that one\n")
-    if response.status_code == 200:
-        print(
-            f"The overpass API at {overpass_url} accepted the query and "
-            f"returned something."
-        )
-        return response.text
-    else:
-        print(response)
-        print(
-            "Yeah, that didn't work. We reached the Overpass API but "
-            "something went wrong on the server side."
-        )
+        return None
+    with response:
+        if response.status_code == 200:
+            print(
+                f"The overpass API at {overpass_url} accepted the query and "
+                f"returned something."
+            )
+            # Decode any transfer compression while streaming to disk
+            response.raw.decode_content = True
+            try:
+                with open(outfile, "wb") as of:
+                    shutil.copyfileobj(response.raw, of, length=1 << 20)
+            except Exception as e:
+                # Never leave a truncated dataset behind
+                print(f"The overpass response was interrupted: {e}")
+                if os.path.exists(outfile):
+                    os.remove(outfile)
+                return None
+            return outfile
+        else:
+            print(response)
+            print(
+                "Yeah, that didn't work. We reached the Overpass API but "
+                "something went wrong on the server side."
+            )
+
+
+def osm2pgsql_cmd(infile, dbd):
+    """Return the osm2pgsql command to load an osm file using the Underpass schema."""
+    style = os.path.join("fmtm_splitter", "raw.lua")
+    return [
+        "osm2pgsql",
+        "--create",
+        "-d",
+        f"postgresql://{dbd[0]}:{dbd[1]}@{dbd[2]}:{dbd[4]}/{dbd[3]}",
+        "--extra-attributes",
+        "--output=flex",
+        "--style",
+        style,
+        infile,
+    ]
 
 
 def dbpush(infile, dbd):
     """Accept an osm file, push it to PostGIS layers using the Underpass schema."""
     try:
         print(f"Trying to turn {infile} into a PostGIS layer")
-        style = os.path.join("fmtm_splitter", "raw.lua")
-        pg = [
-            "osm2pgsql",
-            "--create",
-            "-d",
-            f"postgresql://{dbd[0]}:{dbd[1]}@{dbd[2]}:{dbd[4]}/{dbd[3]}",
-            "--extra-attributes",
-            "--output=flex",
-            "--style",
-            style,
-            infile,
-        ]
+        pg = osm2pgsql_cmd(infile, dbd)
         print(pg)  # just to visually check that this command makes sense
         p = subprocess.run(pg, capture_output=True, encoding="utf-8")
         response = p.stdout
@@ -70,6 +113,69 @@ def dbpush(infile, dbd):
         print(e)
 
 
+def query_to_db(query_string, overpass_url, dbd):
+    """Stream an Overpass query result into PostGIS, without an osm file.
+
+    osm2pgsql reads the response body through a named pipe, so the dataset
+    is never written to disk and read back.
+
+    Returns:
+        int: the osm2pgsql exit code, 1 if the response was interrupted,
+            or None if the query failed.
+    """
+    try:
+        response = session.get(
+            overpass_url,
+            params={"data": query_string},
+            stream=True,
+            timeout=OVERPASS_TIMEOUT,
+        )
+    except Exception:
+        print("overpass did not want to answer that one\n")
+        return None
+    with response, tempfile.TemporaryDirectory() as tmpdir:
+        if response.status_code != 200:
+            print(response)
+            return None
+        response.raw.decode_content = True
+
+        # The .osm suffix lets osm2pgsql detect the input format
+        fifo = os.path.join(tmpdir, "overpass.osm")
+        os.mkfifo(fifo)
+        proc = subprocess.Popen(osm2pgsql_cmd(fifo, dbd))
+
+        # Wait for osm2pgsql to open the pipe, unless it exits first
+        while True:
+            try:
+                fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+                break
+            except OSError as e:
+                if e.errno != errno.ENXIO or proc.poll() is not None:
+                    proc.kill()
+                    return proc.wait()
+                time.sleep(0.1)
+        os.set_blocking(fd, True)
+
+        interrupted = False
+        try:
+            with open(fd, "wb") as pipe:
+                try:
+                    shutil.copyfileobj(response.raw, pipe, length=1 << 20)
+                except BrokenPipeError:
+                    raise
+                except (requests.RequestException, HTTPError, OSError) as e:
+                    # Kill osm2pgsql before the pipe closes, so it never reads
+                    # EOF and imports a truncated dataset
+                    print(f"The overpass response was interrupted: {e}")
+                    proc.kill()
+                    interrupted = True
+        except BrokenPipeError:
+            if not interrupted:
+                print("osm2pgsql stopped reading the Overpass response")
+        returncode = proc.wait()
+        return 1 if interrupted else returncode
+
+
 if __name__ == "__main__":
     """return a file of raw OSM data from Overpass API from an input file
     of text containing working Overpass Query Language, and push that file
@@ -89,6 +195,12 @@ if __name__ == "__main__":
     p.add_argument("-u", "--user", help="Database username")
     p.add_argument("-p", "--password", help="Database password")
     p.add_argument("-po", "--port", help="Database port", default="5432")
+    p.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Stream into the database, without writing an .osm file",
+    )
 
     args = p.parse_args()
 
@@ -103,10 +215,13 @@ if __name__ == "__main__":
     # TODO get bbox from GeoJSON aoi
     bbox = aoiextent(args.boundary)
     qstring = q.read().replace("{{bbox}}", bbox)
-    data = query(qstring, args.overpass_url)
-    with open(osmfilepath, "w") as of:
-        of.write(data)
-        print(f"Wrote {osmfilepath}")
-
     dbdetails = [args.user, args.password, args.host, args.database, args.port]
-    dblayers = dbpush(osmfilepath, dbdetails)
+
+    if args.stream:
+        if query_to_db(qstring, args.overpass_url, dbdetails) != 0:
+            sys.exit("Streaming the overpass query into the database failed")
+    else:
+        if not query(qstring, args.overpass_url, osmfilepath):
+            sys.exit("The overpass query failed, nothing to push to the database")
+        print(f"Wrote {osmfilepath}")
+        dblayers = dbpush(osmfilepath, dbdetails)
@@ -20,33 +20,97 @@
 import argparse
 import json
 import logging
-import math
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from io import BytesIO
+from itertools import compress, islice, repeat
 from pathlib import Path
 from textwrap import dedent
-from typing import Optional, Tuple, Union
+from typing import Iterator, Optional, Tuple, Union
 
 import geojson
 import numpy as np
+import shapely
 from geojson import Feature, FeatureCollection, GeoJSON
-from osm_rawdata.postgres import PostgresClient
 from psycopg2.extensions import connection
-from shapely.geometry import Polygon, box, shape
-from shapely.ops import unary_union
+from shapely.geometry import Polygon, shape
 
 from fmtm_splitter.db import (
-    aoi_to_postgis,
+    BULK_SESSION_SETTINGS,
     close_connection,
     create_connection,
-    create_tables,
+    create_indexes,
     drop_tables,
-    insert_geom,
+    load_geoms,
+    setup_tables,
 )
 
 # Instantiate logger
 log = logging.getLogger(__name__)
 
+# WGS84 ellipsoid parameters
+WGS84_A = 6378137.0  # Semi-major axis in meters
+WGS84_F = 1 / 298.257223563  # Flattening factor
+WGS84_E2 = (2 * WGS84_F) - (WGS84_F**2)  # Eccentricity squared
+
+# Extract features converted to WKB per vectorised call when loading
+GEOM_BATCH_SIZE = 10000
+
+# Boundary grid cells clipped per thread, above which clipping is threaded
+CLIP_CHUNK_SIZE = 1000
+
+# OSM tag keys for polylines used as split boundaries
+LINE_TAG_KEYS = frozenset(("highway", "waterway", "railway"))
+
+# Building count in the AOI, and whether any polyline would split it,
+# using the same splitline filter as fmtm_algorithm.sql
+SINGLE_TASK_CHECK_SQL = """
+    SELECT
+        (
+            SELECT COUNT(b.id) FROM ways_poly b, project_aoi a
+            WHERE ST_Intersects(a.geom, ST_Centroid(b.geom))
+        ),
+        EXISTS (
+            SELECT 1 FROM ways_line l, project_aoi a
+            WHERE ST_Intersects(a.geom, l.geom)
+            AND (
+                (
+                    l.tags->>'highway' IS NOT NULL
+                    AND l.tags->>'highway' NOT IN (
+                        'unclassified', 'residential', 'service',
+                        'pedestrian', 'track', 'bus_guideway'
+                    )
+                )
+                OR l.tags->>'waterway' IS NOT NULL
+                OR l.tags->>'railway' IS NOT NULL
+            )
+        );
+"""
+
+# Underpass extract config, with all polylines for splitting:
+# buildings, highways, waterways, railways
+EXTRACT_CONFIG = dedent(
+    """
+    select:
+    from:
+      - nodes
+      - ways_poly
+      - ways_line
+    where:
+      tags:
+        - building: not null
+          highway: not null
+          waterway: not null
+          railway: not null
+          aeroway: not null
+"""
+).encode()
+
+# The default FMTM splitting algorithm, read once on import
+FMTM_ALGORITHM_SQL = (Path(__file__).parent / "fmtm_algorithm.sql").read_text()
+
 
 class FMTMSplitter(object):
     """A class to split polygons."""
@@ -151,16 +215,37 @@ class FMTMSplitter(object):
 
         return shape(features[0].get("geometry"))
 
+    @staticmethod
+    def geojson_to_shapely_array(geometries: list) -> np.ndarray:
+        """Parse many geometries to an array of shapely geometries.
+
+        GeoJSON dicts are parsed together in a single vectorised call.
+        Anything else accepted by `shape`, such as shapely geometries or
+        objects implementing `__geo_interface__`, is converted one by one.
+        """
+        parsed = np.empty(len(geometries), dtype=object)
+        is_dict = np.array([isinstance(geom, dict) for geom in geometries], dtype=bool)
+        if is_dict.any():
+            parsed[is_dict] = shapely.from_geojson(
+                [json.dumps(geom) for geom in compress(geometries, is_dict)]
+            )
+        if not is_dict.all():
+            parsed[~is_dict] = [shape(geom) for geom in compress(geometries, ~is_dict)]
+        return parsed
+
     def meters_to_degrees(
-        self, meters: float, reference_lat: float
-    ) -> Tuple[float, float]:
+        self,
+        meters: Union[float, np.ndarray],
+        reference_lat: Union[float, np.ndarray],
+    ) -> Tuple[Union[float, np.ndarray], Union[float, np.ndarray]]:
         """Converts meters to degrees at a given latitude.
 
         Using WGS84 ellipsoidal calculations.
+        Also accepts numpy arrays, to convert many values in one call.
 
         Args:
-            meters (float): The distance in meters to convert.
-            reference_lat (float): The latitude at which to ,
+            meters (float, np.ndarray): The distance in meters to convert.
+            reference_lat (float, np.ndarray): The latitude at which to ,
             perform the conversion (in degrees).
 
         Returns:
@@ -170,35 +255,51 @@ class FMTMSplitter(object):
         # The geodesic distance is the shortest distance on the surface
         # of an ellipsoidal model of the earth
 
-        lat_rad = math.radians(reference_lat)
-
-        # Using WGS84 parameters
-        a = 6378137.0  # Semi-major axis in meters
-        f = 1 / 298.257223563  # Flattening factor
+        lat_rad = np.radians(reference_lat)
 
         # Applying formula
-        e2 = (2 * f) - (f**2)  # Eccentricity squared
-        n = a / math.sqrt(
-            1 - e2 * math.sin(lat_rad) ** 2
-        )  # Radius of curvature in the prime vertical
+        w = 1 - WGS84_E2 * np.sin(lat_rad) ** 2
+        n = WGS84_A / np.sqrt(w)  # Radius of curvature in the prime vertical
         m = (
-            a * (1 - e2) / (1 - e2 * math.sin(lat_rad) ** 2) ** (3 / 2)
+            WGS84_A * (1 - WGS84_E2) / w ** (3 / 2)
         )  # Radius of curvature in the meridian
 
         lat_deg_change = meters / m  # Latitude change in degrees
-        lon_deg_change = meters / (n * math.cos(lat_rad))  # Longitude change in degrees
+        lon_deg_change = meters / (n * np.cos(lat_rad))  # Longitude change in degrees
 
         # Convert changes to degrees by dividing by radians to degrees
-        lat_deg_change = math.degrees(lat_deg_change)
-        lon_deg_change = math.degrees(lon_deg_change)
+        lat_deg_change = np.degrees(lat_deg_change)
+        lon_deg_change = np.degrees(lon_deg_change)
 
         return lat_deg_change, lon_deg_change
 
+    def clip_to_aoi(self, cells: np.ndarray) -> np.ndarray:
+        """Intersect an array of geometries with the AOI.
+
+        GEOS releases the GIL, so large arrays are clipped in chunks
+        across a thread pool, one chunk per core.
+
+        Args:
+            cells (np.ndarray): Shapely geometries to clip.
+
+        Returns:
+            np.ndarray: The clipped geometries, in the same order.
+        """
+        workers = os.cpu_count() or 1
+        if workers == 1 or len(cells) <= CLIP_CHUNK_SIZE:
+            return shapely.intersection(cells, self.aoi)
+
+        chunks = np.array_split(cells, min(workers, len(cells) // CLIP_CHUNK_SIZE))
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            clipped = pool.map(shapely.intersection, chunks, repeat(self.aoi))
+            return np.concatenate(list(clipped))
+
     def splitBySquare(  # noqa: N802
         self,
         meters: int,
         db: Union[str, connection],
         extract_geojson: Optional[Union[dict, FeatureCollection]] = None,
+        session_settings: Optional[dict[str, str]] = None,
     ) -> FeatureCollection:
         """Split the polygon into squares.
 
@@ -211,6 +312,8 @@ class FMTMSplitter(object):
                 database connections to be spawned.
             extract_geojson (dict, FeatureCollection): an OSM extract geojson,
                 containing building polygons, or linestrings.
+            session_settings (dict): Postgres settings for a new connection,
+                e.g. BULK_SESSION_SETTINGS. Unused if `db` is a connection.
 
         Returns:
             data (FeatureCollection): A multipolygon of all the task boundaries.
@@ -222,11 +325,14 @@ class FMTMSplitter(object):
         reference_lat = (ymin + ymax) / 2
         length_deg, width_deg = self.meters_to_degrees(meters, reference_lat)
 
-        # Create grid columns and rows based on the AOI bounds
-        cols = np.arange(xmin, xmax + width_deg, width_deg)
-        rows = np.arange(ymin, ymax + length_deg, length_deg)
+        # Create grid columns and rows based on the AOI bounds, placed by
+        # integer index so float steps cannot drift into an extra cell
+        ncols = max(int(np.ceil((xmax - xmin) / width_deg)), 1)
+        nrows = max(int(np.ceil((ymax - ymin) / length_deg)), 1)
+        cols = xmin + np.arange(ncols, dtype=np.int32) * width_deg
+        rows = ymin + np.arange(nrows, dtype=np.int32) * length_deg
 
-        with create_connection(db) as conn:
+        with create_connection(db, session_settings) as conn:
             with conn.cursor() as cur:
                 # Drop the table if it exists
                 cur.execute("DROP TABLE IF EXISTS temp_polygons;")
@@ -239,46 +345,63 @@ class FMTMSplitter(object):
                     );
                 """)
 
-                extract_geoms = []
+                extract_centroids = None
                 if extract_geojson:
                     features = (
                         extract_geojson.get("features", extract_geojson)
                         if isinstance(extract_geojson, dict)
                         else extract_geojson.features
                     )
-                    extract_geoms = [shape(feature["geometry"]) for feature in features]
-
-                # Generate grid polygons and clip them by AOI
-                polygons = []
-                for x in cols[:-1]:
-                    for y in rows[:-1]:
-                        grid_polygon = box(x, y, x + width_deg, y + length_deg)
-                        clipped_polygon = grid_polygon.intersection(self.aoi)
-
-                        if clipped_polygon.is_empty:
-                            continue
-
-                        # Check intersection with extract geometries if available
-                        if extract_geoms:
-                            if any(
-                                geom.centroid.within(clipped_polygon)
-                                for geom in extract_geoms
-                            ):
-                                polygons.append(
-                                    (clipped_polygon.wkt, clipped_polygon.wkt)
-                                )
-
-                        else:
-                            polygons.append((clipped_polygon.wkt, clipped_polygon.wkt))
-
+                    # Parse extract geometries and centroids as shapely arrays
+                    extract_geoms = self.geojson_to_shapely_array(
+                        [feature["geometry"] for feature in features]
+                    )
+                    extract_centroids = shapely.centroid(extract_geoms)
+
+                # Generate grid polygons and clip them by AOI, as arrays
+                xs, ys = np.meshgrid(cols, rows, indexing="ij")
+                xs, ys = xs.ravel(), ys.ravel()
+                envelope_area = self.aoi.envelope.area
+                if envelope_area - self.aoi.area <= 1e-6 * envelope_area:
+                    # A rectangular AOI covers the whole grid, apart from the
+                    # overhang of the last row and column, so trim by bounds
+                    inside = (xs < xmax) & (ys < ymax)
+                    xs, ys = xs[inside], ys[inside]
+                    clipped_polygons = shapely.box(
+                        xs,
+                        ys,
+                        np.minimum(xs + width_deg, xmax),
+                        np.minimum(ys + length_deg, ymax),
+                    )
+                else:
+                    grid_polygons = shapely.box(xs, ys, xs + width_deg, ys + length_deg)
+                    shapely.prepare(self.aoi)
+                    in_aoi = shapely.intersects(self.aoi, grid_polygons)
+                    grid_polygons = grid_polygons[in_aoi]
+                    # Only cells crossing the AOI boundary need clipping
+                    boundary = ~shapely.contains(self.aoi, grid_polygons)
+                    grid_polygons[boundary] = self.clip_to_aoi(grid_polygons[boundary])
+                    clipped_polygons = grid_polygons[~shapely.is_empty(grid_polygons)]
+
+                # Keep only cells containing an extract centroid, if available
+                if extract_centroids is not None:
+                    tree = shapely.STRtree(extract_centroids)
+                    cell_idx, _ = tree.query(clipped_polygons, predicate="contains")
+                    clipped_polygons = clipped_polygons[np.unique(cell_idx)]
+
+                # Insert all cells in a single statement, as an array of WKB
                 insert_query = """
                         INSERT INTO temp_polygons (geom, area)
-                        SELECT ST_GeomFromText(%s, 4326),
-                        ST_Area(ST_GeomFromText(%s, 4326)::geography)
+                        SELECT geom, ST_Area(geom::geography)
+                        FROM (
+                            SELECT ST_GeomFromWKB(wkb, 4326) AS geom
+                            FROM UNNEST(%s) AS wkb
+                        ) AS cells;
                     """
 
-                if polygons:
-                    cur.executemany(insert_query, polygons)
+                if len(clipped_polygons):
+                    polygons = shapely.to_wkb(clipped_polygons).tolist()
+                    cur.execute(insert_query, (polygons,))
 
                 area_threshold = 0.35 * (meters**2)
 
@@ -324,24 +447,26 @@ class FMTMSplitter(object):
                     (area_threshold,),
                 )
 
-                cur.execute(
-                    """
-                    SELECT
-                    JSONB_BUILD_OBJECT(
-                    'type', 'FeatureCollection',
-                    'features', JSONB_AGG(feature)
-                    )
-                    FROM(
-                    SELECT JSONB_BUILD_OBJECT(
-                    'type', 'Feature',
-                    'properties', JSONB_BUILD_OBJECT('area', (t.area)),
-                    'geometry', ST_ASGEOJSON(t.geom)::json
-                    ) AS feature
-                    FROM temp_polygons as t
-                    ) AS features;
-                    """
+            # Fetch each feature as a row, instead of aggregating into a
+            # single large JSON document. The GeoJSON keeps the 9 digit
+            # ST_AsGeoJSON precision, decoded by psycopg2 as json
+            with conn.cursor() as feature_cur:
+                feature_cur.execute(
+                    "SELECT ST_AsGeoJSON(t.geom)::json, t.area FROM temp_polygons as t;"
                 )
-                self.split_features = cur.fetchone()[0]
+                features = [
+                    {
+                        "type": "Feature",
+                        "properties": {"area": area},
+                        "geometry": geometry,
+                    }
+                    for geometry, area in feature_cur
+                ]
+            # Matches the JSONB_AGG output, where no rows gives null features
+            self.split_features = {
+                "type": "FeatureCollection",
+                "features": features or None,
+            }
         return self.split_features
 
     def splitBySQL(  # noqa: N802
@@ -350,6 +475,7 @@ class FMTMSplitter(object):
         db: Union[str, connection],
         buildings: Optional[int] = None,
         osm_extract: Optional[Union[dict, FeatureCollection]] = None,
+        session_settings: Optional[dict[str, str]] = None,
     ) -> FeatureCollection:
         """Split the polygon by features in the database using an SQL query.
 
@@ -365,6 +491,9 @@ class FMTMSplitter(object):
             buildings (int): The number of buildings in each task
             osm_extract (dict, FeatureCollection): an OSM extract geojson,
                 containing building polygons, or linestrings.
+                Feature geometries may also be given as WKB bytes.
+            session_settings (dict): Postgres settings for a new connection,
+                e.g. BULK_SESSION_SETTINGS. Unused if `db` is a connection.
 
         Returns:
             data (FeatureCollection): A multipolygon of all the task boundaries.
@@ -384,7 +513,7 @@ class FMTMSplitter(object):
                 "No `buildings` or `osm_extract` params passed, executing custom SQL"
             )
             # FIXME untested
-            conn = create_connection(db)
+            conn = create_connection(db, session_settings)
             splitter_cursor = conn.cursor()
             log.debug("Running custom splitting algorithm")
             splitter_cursor.execute(sql)
@@ -397,85 +526,136 @@ class FMTMSplitter(object):
             return self.split_features
 
         # Get existing db engine, or create new one
-        conn = create_connection(db)
+        conn = create_connection(db, session_settings)
 
-        # Generate db tables if not exist
+        # Generate db tables with the AOI, in one round trip. lines_view is
+        # only needed by custom SQL, as the default algorithm reads ways_line
         log.debug("Generating required temp tables")
-        create_tables(conn)
+        setup_tables(
+            conn,
+            self.aoi,
+            lines_view=sql is not FMTM_ALGORITHM_SQL and "lines_view" in sql,
+        )
 
-        # Add aoi to project_aoi table
-        aoi_to_postgis(conn, self.aoi)
+        @lru_cache(maxsize=4096)
+        def parse_json_str(json_str: str) -> dict:
+            """Parse a JSON string, cached as many features share tags."""
+            try:
+                return json.loads(json_str)
+            except json.JSONDecodeError:
+                msg = f"Error decoding key in GeoJSON: {json_str}"
+                log.error(msg)
+                # Set tags to empty, skip feature
+                return {}
 
         def json_str_to_dict(json_item: Union[str, dict]) -> dict:
             """Convert a JSON string to dict."""
             if isinstance(json_item, dict):
                 return json_item
             if isinstance(json_item, str):
-                try:
-                    return json.loads(json_item)
-                except json.JSONDecodeError:
-                    msg = f"Error decoding key in GeoJSON: {json_item}"
-                    log.error(msg)
-                    # Set tags to empty, skip feature
-                    return {}
-
-        # Insert data extract into db, using same cursor
+                return parse_json_str(json_item)
+
+        def extract_rows(lines: bool) -> Iterator[tuple]:
+            """Yield (osm_id, geometry, tags) for buildings, or polylines."""
+            for feature in osm_extract["features"]:
+                # NOTE must handle format generated from FMTMSplitter __init__
+                properties = feature.get("properties", {})
+                if "tags" in properties.keys():
+                    # Sometimes tags are placed under tags key
+                    tags = properties.get("tags", {})
+                else:
+                    # Sometimes tags are directly in properties
+                    tags = properties
+
+                # Handle nested 'tags' key if present
+                parsed_tags = json_str_to_dict(tags)
+                tags = parsed_tags.get("tags", parsed_tags)
+
+                # Building polygons
+                if tags.get("building") == "yes":
+                    is_line = False
+                # Highway/waterway/railway polylines
+                elif not LINE_TAG_KEYS.isdisjoint(tags):
+                    is_line = True
+                else:
+                    continue
+
+                if is_line == lines:
+                    yield (properties.get("osm_id"), feature["geometry"], tags)
+
+        def to_db_rows(rows: Iterator[tuple]) -> Iterator[tuple]:
+            """Yield rows to load, converting geometries to WKB in batches."""
+            while batch := list(islice(rows, GEOM_BATCH_SIZE)):
+                osm_ids, geometries, tags_list = zip(*batch, strict=True)
+                # Geometries already provided as WKB bytes are passed through
+                wkbs = [
+                    bytes(geom) if isinstance(geom, (bytes, bytearray)) else None
+                    for geom in geometries
+                ]
+                # Convert the remaining geometries in a single vectorised call
+                if pending := [i for i, wkb in enumerate(wkbs) if wkb is None]:
+                    geoms = self.geojson_to_shapely_array(
+                        [geometries[i] for i in pending]
+                    )
+                    converted = shapely.to_wkb(geoms).tolist()
+                    for i, wkb in zip(pending, converted, strict=True):
+                        wkbs[i] = wkb
+                # Serialise tags once, rather than via the dict adapter per row
+                tags_json = (json.dumps(tags) for tags in tags_list)
+                yield from zip(osm_ids, wkbs, tags_json, strict=True)
+
+        # Insert data extract into db, using same cursor. Each table takes
+        # its own pass over the extract, so only one batch of converted
+        # rows is held at a time, on top of the caller's extract
         log.debug("Inserting data extract into db")
         cur = conn.cursor()
-        for feature in osm_extract["features"]:
-            # NOTE must handle format generated from FMTMSplitter __init__
-            wkb_element = shape(feature["geometry"]).wkb_hex
-            properties = feature.get("properties", {})
-            if "tags" in properties.keys():
-                # Sometimes tags are placed under tags key
-                tags = properties.get("tags", {})
-            else:
-                # Sometimes tags are directly in properties
-                tags = properties
-
-            # Handle nested 'tags' key if present
-            tags = json_str_to_dict(tags).get("tags", json_str_to_dict(tags))
-            osm_id = properties.get("osm_id")
-
-            # Common attributes for db tables
-            common_args = dict(osm_id=osm_id, geom=wkb_element, tags=tags)
-
-            # Insert building polygons
-            if tags.get("building") == "yes":
-                insert_geom(cur, "ways_poly", **common_args)
-
-            # Insert highway/waterway/railway polylines
-            elif any(key in tags for key in ["highway", "waterway", "railway"]):
-                insert_geom(cur, "ways_line", **common_args)
-
-        # Use raw sql for view generation & remainder of script
-        # TODO get geom from project_aoi table instead of wkb string
-        log.debug("Creating db view with intersecting polylines")
-        view = (
-            "DROP VIEW IF EXISTS lines_view;"
-            "CREATE VIEW lines_view AS SELECT "
-            "tags,geom FROM ways_line WHERE "
-            "ST_Intersects(ST_SetSRID(CAST(%s AS GEOMETRY), 4326), geom)"
-        )
-        cur.execute(view, (self.aoi.wkb_hex,))
+        load_geoms(cur, "ways_poly", to_db_rows(extract_rows(lines=False)))
+        load_geoms(cur, "ways_line", to_db_rows(extract_rows(lines=True)))
+
+        # Index the extract only once it is fully loaded
+        create_indexes(conn)
+
+        # Count buildings first, as the default algorithm is wasted on a
+        # single task, unless a road, river or railway would still split the
+        # AOI. Custom SQL has its own rules, so is always run
+        building_count, has_split_lines = None, True
+        if sql is FMTM_ALGORITHM_SQL:
+            cur.execute(SINGLE_TASK_CHECK_SQL)
+            building_count, has_split_lines = cur.fetchone()
         # Close current cursor
         cur.close()
 
-        splitter_cursor = conn.cursor()
-        log.debug("Running task splitting algorithm")
-        splitter_cursor.execute(sql, {"num_buildings": buildings})
-
-        features = splitter_cursor.fetchall()[0][0]["features"]
-        if features:
-            log.info(f"Query returned {len(features)} features")
+        # Matches the algorithm's cluster count, numfeatures / num_buildings + 1
+        if not has_split_lines and building_count < int(buildings):
+            log.info(
+                f"AOI contains {building_count} buildings, returning as single task"
+            )
+            features = [
+                Feature(
+                    geometry=self.aoi,
+                    properties={"building_count": building_count},
+                )
+            ]
         else:
-            log.info("Query returned no features")
+            splitter_cursor = conn.cursor()
+            log.debug("Running task splitting algorithm")
+            splitter_cursor.execute(sql, {"num_buildings": buildings})
+
+            features = splitter_cursor.fetchall()[0][0]["features"]
+            if features:
+                log.info(f"Query returned {len(features)} features")
+            else:
+                log.info("Query returned no features")
 
         self.split_features = FeatureCollection(features)
 
         # Drop tables & close (+commit) db connection
         drop_tables(conn)
-        close_connection(conn)
+        if isinstance(db, str):
+            close_connection(conn)
+        else:
+            # Connection is owned by the caller (e.g. a pool), commit only
+            conn.commit()
 
         return self.split_features
 
@@ -493,25 +673,32 @@ class FMTMSplitter(object):
             data (FeatureCollection): A multipolygon of all the task boundaries.
         """
         log.debug("Polygonising the FeatureCollection features")
-        # Extract all geometries from the input features
-        geometries = []
-        for feature in features["features"]:
-            geom = feature["geometry"]
-            if geom["type"] == "Polygon":
-                geometries.append(shape(geom))
-            elif geom["type"] == "LineString":
-                geometries.append(shape(geom))
-            else:
-                log.warning(f"Ignoring unsupported geometry type: {geom['type']}")
+        # Parse all geometries in one call, then keep polygons and linestrings
+        geometries = self.geojson_to_shapely_array(
+            [feature["geometry"] for feature in features["features"]]
+        )
+        supported = np.isin(
+            shapely.get_type_id(geometries),
+            (shapely.GeometryType.POLYGON, shapely.GeometryType.LINESTRING),
+        )
+        for geom_type in np.unique(shapely.get_type_id(geometries[~supported])):
+            log.warning(
+                "Ignoring unsupported geometry type: "
+                f"{shapely.GeometryType(geom_type).name}"
+            )
+        geometries = geometries[supported]
 
-        # Create a single MultiPolygon from all the polygons and linestrings
-        multi_polygon = unary_union(geometries)
+        # Drop features outside the AOI before the union, the costliest step
+        shapely.prepare(self.aoi)
+        geometries = geometries[shapely.intersects(self.aoi, geometries)]
 
-        # Clip the multi_polygon by the AOI boundary
-        clipped_multi_polygon = multi_polygon.intersection(self.aoi)
+        # Union, clip and explode as whole arrays, each in a single GEOS call
+        multi_polygon = shapely.union_all(geometries)
+        clipped_multi_polygon = shapely.intersection(multi_polygon, self.aoi)
 
         polygon_features = [
-            Feature(geometry=polygon) for polygon in list(clipped_multi_polygon.geoms)
+            Feature(geometry=polygon)
+            for polygon in shapely.get_parts(clipped_multi_polygon)
         ]
 
         # Convert the Polygon Features into a FeatureCollection
@@ -529,17 +716,43 @@ class FMTMSplitter(object):
             log.error(msg)
             raise RuntimeError(msg)
 
+        # Write one feature at a time, so each is serialised in a single
+        # call, without building the whole document in memory
+        features = self.split_features.get("features")
         with open(filename, "w") as jsonfile:
-            geojson.dump(self.split_features, jsonfile)
+            if features is None:
+                geojson.dump(self.split_features, jsonfile)
+            else:
+                jsonfile.write('{"type": "FeatureCollection", "features": [')
+                for index, feature in enumerate(features):
+                    if index:
+                        jsonfile.write(", ")
+                    jsonfile.write(geojson.dumps(feature))
+                jsonfile.write("]}")
             log.debug(f"Wrote split features to {filename}")
 
 
+@lru_cache(maxsize=4)
+def read_sql_file(sql_path: Path, mtime_ns: int) -> str:
+    """Read a custom SQL splitting algorithm, once per file version.
+
+    Args:
+        sql_path (Path): Resolved path to the SQL file.
+        mtime_ns (int): The file modification time, so edits are re-read.
+
+    Returns:
+        str: The SQL query.
+    """
+    return sql_path.read_text()
+
+
 def split_by_square(
     aoi: Union[str, FeatureCollection],
     db: Union[str, connection],
     meters: int = 100,
     osm_extract: Union[str, FeatureCollection] = None,
     outfile: Optional[str] = None,
+    session_settings: Optional[dict[str, str]] = None,
 ) -> FeatureCollection:
     """Split an AOI by square, dividing into an even grid.
 
@@ -559,6 +772,8 @@ def split_by_square(
             It is recommended to leave this param as default, unless you know
             what you are doing.
         outfile(str): Output to a GeoJSON file on disk.
+        session_settings (dict): Opt-in Postgres settings for connections
+            opened from a db url, e.g. BULK_SESSION_SETTINGS.
 
     Returns:
         features (FeatureCollection): A multipolygon of all the task boundaries.
@@ -568,7 +783,10 @@ def split_by_square(
     aoi_featcol = FMTMSplitter.geojson_to_featcol(parsed_aoi)
     extract_geojson = None
 
-    if osm_extract:
+    if isinstance(osm_extract, dict):
+        # Used as-is, as splitBySquare only reads the feature geometries
+        extract_geojson = osm_extract
+    elif osm_extract:
         extract_geojson = FMTMSplitter.input_to_geojson(osm_extract)
 
     # Handle multiple geometries passed
@@ -579,16 +797,19 @@ def split_by_square(
                 FeatureCollection(features=[feat]),
                 db,
                 meters,
-                None,
+                # Reuse the parsed extract for every feature
+                extract_geojson,
                 f"{Path(outfile).stem}_{index}.geojson)" if outfile else None,
+                session_settings,
             )
-            if feats := featcol.get("features", []):
-                features += feats
+            features.extend(featcol.get("features") or [])
         # Parse FeatCols into single FeatCol
         split_features = FeatureCollection(features)
     else:
         splitter = FMTMSplitter(aoi_featcol)
-        split_features = splitter.splitBySquare(meters, db, extract_geojson)
+        split_features = splitter.splitBySquare(
+            meters, db, extract_geojson, session_settings
+        )
         if not split_features:
             msg = "Failed to generate split features."
             log.error(msg)
@@ -606,6 +827,7 @@ def split_by_sql(
     num_buildings: Optional[int] = None,
     outfile: Optional[str] = None,
     osm_extract: Optional[Union[str, FeatureCollection]] = None,
+    session_settings: Optional[dict[str, str]] = None,
 ) -> FeatureCollection:
     """Split an AOI with a custom SQL query or default FMTM query.
 
@@ -637,6 +859,8 @@ def split_by_sql(
             Optional param, if not included an extract is generated for you.
             It is recommended to leave this param as default, unless you know
             what you are doing.
+        session_settings (dict): Opt-in Postgres settings for connections
+            opened from a db url, e.g. BULK_SESSION_SETTINGS.
 
     Returns:
         features (FeatureCollection): A multipolygon of all the task boundaries.
@@ -647,11 +871,11 @@ def split_by_sql(
         raise ValueError(err)
 
     # Use FMTM splitter of num_buildings set, else use custom SQL
-    if not sql_file:
-        sql_file = Path(__file__).parent / "fmtm_algorithm.sql"
-
-    with open(sql_file, "r") as sql:
-        query = sql.read()
+    if sql_file:
+        sql_path = Path(sql_file).resolve()
+        query = read_sql_file(sql_path, sql_path.stat().st_mtime_ns)
+    else:
+        query = FMTM_ALGORITHM_SQL
 
     # Parse AOI
     parsed_aoi = FMTMSplitter.input_to_geojson(aoi)
@@ -659,30 +883,13 @@ def split_by_sql(
 
     # Extracts and parse extract geojson
     if not osm_extract:
-        # We want all polylines for splitting:
-        # buildings, highways, waterways, railways
-        config_data = dedent(
-            """
-            select:
-            from:
-              - nodes
-              - ways_poly
-              - ways_line
-            where:
-              tags:
-                - building: not null
-                  highway: not null
-                  waterway: not null
-                  railway: not null
-                  aeroway: not null
-        """
-        )
-        # Must be a BytesIO JSON object
-        config_bytes = BytesIO(config_data.encode())
+        # Imported here, as it is only needed to generate an extract
+        from osm_rawdata.postgres import PostgresClient
 
         pg = PostgresClient(
             "underpass",
-            config_bytes,
+            # Must be a BytesIO JSON object
+            BytesIO(EXTRACT_CONFIG),
         )
         # The total FeatureCollection area merged by osm-rawdata automatically
         extract_geojson = pg.execQuery(
@@ -690,6 +897,10 @@ def split_by_sql(
             extra_params={"fileName": "fmtm_splitter", "useStWithin": False},
         )
 
+    elif isinstance(osm_extract, dict):
+        # Used as-is, as splitBySQL only reads plain dict keys, rather than
+        # round tripping every feature through geojson objects
+        extract_geojson = osm_extract
     else:
         extract_geojson = FMTMSplitter.input_to_geojson(osm_extract)
 
@@ -700,25 +911,34 @@ def split_by_sql(
 
     # Handle multiple geometries passed
     if len(feat_array := aoi_featcol.get("features", [])) > 1:
+        # Open one connection for every feature, rather than one each
+        conn = create_connection(db, session_settings)
         features = []
-        for index, feat in enumerate(feat_array):
-            featcol = split_by_sql(
-                FeatureCollection(features=[feat]),
-                db,
-                sql_file,
-                num_buildings,
-                f"{Path(outfile).stem}_{index}.geojson)" if outfile else None,
-                osm_extract,
-            )
-            feats = featcol.get("features", [])
-            if feats:
-                features += feats
+        try:
+            for index, feat in enumerate(feat_array):
+                featcol = split_by_sql(
+                    FeatureCollection(features=[feat]),
+                    conn,
+                    sql_file,
+                    num_buildings,
+                    f"{Path(outfile).stem}_{index}.geojson)" if outfile else None,
+                    # Reuse the extract, rather than generating one per feature
+                    extract_geojson,
+                )
+                features.extend(featcol.get("features") or [])
+        finally:
+            if isinstance(db, str):
+                close_connection(conn)
         # Parse FeatCols into single FeatCol
         split_features = FeatureCollection(features)
     else:
         splitter = FMTMSplitter(aoi_featcol)
         split_features = splitter.splitBySQL(
-            query, db, num_buildings, osm_extract=extract_geojson
+            query,
+            db,
+            num_buildings,
+            osm_extract=extract_geojson,
+            session_settings=session_settings,
         )
         if not split_features:
             msg = "Failed to generate split features."
@@ -796,9 +1016,7 @@ def split_by_features(
                 input_featcol,
                 f"{Path(outfile).stem}_{index}.geojson)" if outfile else None,
             )
-            feats = featcol.get("features", [])
-            if feats:
-                features += feats
+            features.extend(featcol.get("features") or [])
         # Parse FeatCols into single FeatCol
         split_features = FeatureCollection(features)
     else:
@@ -867,6 +1085,11 @@ be either the data extract used by the XLSForm, or a postgresql database.
     parser.add_argument(
         "-e", "--extract", help="The OSM data extract for fmtm splitter"
     )
+    parser.add_argument(
+        "--bulk-session",
+        action="store_true",
+        help="Tune the db session for bulk loading, with synchronous_commit off",
+    )
 
     # Accept command line args, or func params
     args = parser.parse_args(args_list)
@@ -891,6 +1114,8 @@ be either the data extract used by the XLSForm, or a postgresql database.
         log.error(err)
         raise ValueError(err)
 
+    session_settings = BULK_SESSION_SETTINGS if args.bulk_session else None
+
     if args.meters:
         split_by_square(
             args.boundary,
@@ -898,6 +1123,7 @@ be either the data extract used by the XLSForm, or a postgresql database.
             meters=args.meters,
             outfile=args.outfile,
             osm_extract=args.extract,
+            session_settings=session_settings,
         )
     elif args.number:
         split_by_sql(
@@ -907,6 +1133,7 @@ be either the data extract used by the XLSForm, or a postgresql database.
             num_buildings=args.number,
             outfile=args.outfile,
             osm_extract=args.extract,
+            session_settings=session_settings,
         )
     # Split by feature using geojson
     elif args.source and args.source[3:] != "PG:":
@@ -0,0 +1,172 @@
+# Copyright (c) Humanitarian OpenStreetMap Team
+#
+# This file is part of fmtm-splitter.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with fmtm-splitter.  If not, see <https:#www.gnu.org/licenses/>.
+#
+"""Test the splitter API, without a database."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+anyio = pytest.importorskip("anyio")
+pytest.importorskip("litestar")
+
+from litestar.di import Provide  # noqa: E402
+from litestar.testing import create_test_client  # noqa: E402
+from psycopg2.extensions import connection  # noqa: E402
+
+from api import main  # noqa: E402
+from api.db import provide_db_conn  # noqa: E402
+
+AOI = {
+    "type": "Polygon",
+    "coordinates": [[[85.3, 27.71], [85.3, 27.7], [85.31, 27.7], [85.3, 27.71]]],
+}
+SPLIT_FEATURES = {
+    "type": "FeatureCollection",
+    "features": [
+        {
+            "type": "Feature",
+            "properties": {"area": 1.0},
+            "geometry": {"type": "Polygon", "coordinates": AOI["coordinates"]},
+        },
+        {
+            "type": "Feature",
+            "properties": {"area": 2.0},
+            "geometry": {"type": "Polygon", "coordinates": AOI["coordinates"]},
+        },
+    ],
+}
+
+
+class StubConnection(connection):
+    """A psycopg2 connection type that never connects."""
+
+
+def provide_stub_conn() -> connection:
+    """Provide an unconnected stand-in for the pooled db connection."""
+    return StubConnection.__new__(StubConnection)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Test client for the split endpoints, without a database."""
+    monkeypatch.setattr(main, "split_by_square", lambda *args, **kw: SPLIT_FEATURES)
+    with create_test_client(
+        route_handlers=[main.aoi_split_by_square],
+        dependencies={"db": Provide(provide_stub_conn, sync_to_thread=False)},
+    ) as test_client:
+        yield test_client
+
+
+class FakePool:
+    """Stand-in for ThreadedConnectionPool, failing when exhausted."""
+
+    def __init__(self, maxconn: int):
+        """Track connections in use."""
+        self.maxconn = maxconn
+        self.in_use = 0
+        self.peak = 0
+
+    def getconn(self):
+        """Borrow a connection, raising like psycopg2 when none are left."""
+        if self.in_use == self.maxconn:
+            raise RuntimeError("connection pool exhausted")
+        self.in_use += 1
+        self.peak = max(self.peak, self.in_use)
+        return SimpleNamespace(closed=False, rollback=lambda: None)
+
+    def putconn(self, conn):
+        """Return a connection."""
+        self.in_use -= 1
+
+
+def test_provide_db_conn_waits_for_pool():
+    """Test requests beyond the pool size wait for a free connection."""
+    state = SimpleNamespace(
+        db_pool=FakePool(2), db_pool_limiter=anyio.CapacityLimiter(2)
+    )
+
+    async def request():
+        provider = provide_db_conn(state)
+        await provider.__anext__()
+        await anyio.sleep(0.01)
+        await provider.aclose()
+
+    async def run_requests():
+        async with anyio.create_task_group() as tg:
+            for _ in range(10):
+                tg.start_soon(request)
+
+    anyio.run(run_requests)
+    assert state.db_pool.peak == 2
+    assert state.db_pool.in_use == 0
+
+
+def test_split_response_json(client):
+    """Test split features are returned as a single GeoJSON document."""
+    response = client.post("/squares/", json={"aoi": AOI, "dimension": 50})
+    assert response.status_code == 201
+    assert response.headers["content-type"].startswith("application/json")
+    assert response.json() == SPLIT_FEATURES
+
+
+def test_split_response_geojson_seq(client):
+    """Test split features are streamed as a GeoJSON Text Sequence."""
+    response = client.post(
+        "/squares/",
+        json={"aoi": AOI, "dimension": 50},
+        headers={"Accept": main.GEOJSON_SEQ},
+    )
+    assert response.status_code == 201
+    assert response.headers["content-type"].startswith(main.GEOJSON_SEQ)
+    records = response.content.split(b"\x1e")
+    assert records[0] == b""
+    assert [json.loads(record) for record in records[1:]] == (
+        SPLIT_FEATURES["features"]
+    )
+    assert all(record.endswith(b"\n") for record in records[1:])
+
+
+def test_split_invalid_aoi(client, monkeypatch):
+    """Test a failed split is returned to the client as a 400."""
+
+    def split_fails(*args, **kwargs):
+        raise ValueError("The input AOI contains no geometries.")
+
+    monkeypatch.setattr(main, "split_by_square", split_fails)
+    response = client.post("/squares/", json={"aoi": AOI, "dimension": 50})
+    assert response.status_code == 400
+    assert "The input AOI contains no geometries." in response.json()["detail"]
+
+
+@pytest.mark.parametrize(
+    "coordinates",
+    [
+        # Not closed
+        [[[85.3, 27.71], [85.3, 27.7], [85.31, 27.7], [85.31, 27.71]]],
+        # Too few positions
+        [[[85.3, 27.71], [85.3, 27.7], [85.3, 27.71]]],
+        # No rings
+        [],
+    ],
+)
+def test_split_invalid_polygon(client, coordinates):
+    """Test an invalid Polygon is rejected with a 400 before splitting."""
+    aoi = {"type": "Polygon", "coordinates": coordinates}
+    response = client.post("/squares/", json={"aoi": aoi, "dimension": 50})
+    assert response.status_code == 400
@@ -0,0 +1,175 @@
+# Copyright (c) Humanitarian OpenStreetMap Team
+#
+# This file is part of fmtm-splitter.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with fmtm-splitter.  If not, see <https:#www.gnu.org/licenses/>.
+#
+"""Test database loading helpers, without a database."""
+
+import struct
+from types import SimpleNamespace
+
+from shapely import Point
+
+from fmtm_splitter import db
+from fmtm_splitter.db import (
+    BULK_SESSION_SETTINGS,
+    INSERT_PAGE_SIZE,
+    BinaryCopyReader,
+    copy_geoms,
+    create_connection,
+    insert_geom,
+    load_geoms,
+    setup_tables,
+)
+
+
+class RecordingCursor:
+    """Stand-in for a psycopg2 cursor, recording the commands sent."""
+
+    def __init__(self):
+        """Start with no commands."""
+        self.copies = []
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        """Record an SQL command."""
+        self.executed.append(sql)
+
+    def copy_expert(self, sql, file, size=8192):
+        """Record a COPY command and its data, read in chunks like psycopg2."""
+        chunks = iter(lambda: file.read(size), b"")
+        self.copies.append((sql, b"".join(chunks)))
+
+
+def test_copy_geoms_binary_framing():
+    """Test rows are framed in the PostgreSQL binary COPY format."""
+    wkb = Point(85.3, 27.7).wkb
+    cur = RecordingCursor()
+    rows = [("123", wkb, '{"building": "yes"}'), (None, wkb, "{}")]
+    copy_geoms(cur, "ways_poly", rows)
+
+    sql, data = cur.copies[0]
+    assert sql == (
+        "COPY ways_poly (osm_id, geom, tags) FROM STDIN WITH (FORMAT binary)"
+    )
+    # Signature, then 32-bit flags and header extension length
+    assert data.startswith(b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0))
+    assert data.endswith(struct.pack("!h", -1))
+
+    body = data[19:-2]
+    expected = b"".join(
+        [
+            struct.pack("!h", 3),
+            struct.pack("!i", 3) + b"123",
+            struct.pack("!i", len(wkb)) + wkb,
+            # JSONB version byte, then the JSON text
+            struct.pack("!i", 20) + b'\x01{"building": "yes"}',
+            struct.pack("!h", 3),
+            # A NULL osm_id has length -1 and no data
+            struct.pack("!i", -1),
+            struct.pack("!i", len(wkb)) + wkb,
+            struct.pack("!i", 3) + b"\x01{}",
+        ]
+    )
+    assert body == expected
+
+
+def test_copy_geoms_no_rows():
+    """Test an empty COPY still sends a valid header and trailer."""
+    cur = RecordingCursor()
+    copy_geoms(cur, "ways_line", [])
+    assert cur.copies[0][1] == (
+        b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0) + struct.pack("!h", -1)
+    )
+
+
+def test_copy_geoms_streams_rows():
+    """Test rows are only pulled from the iterable as data is read."""
+    wkb = Point(85.3, 27.7).wkb
+    consumed = []
+
+    def rows():
+        for i in range(1000):
+            consumed.append(i)
+            yield (str(i), wkb, "{}")
+
+    reader = BinaryCopyReader(rows())
+    first = reader.read(100)
+    assert len(first) == 100
+    assert len(consumed) < 10
+
+    # Chunked reads give the same bytes as a single read
+    rest = b"".join(iter(lambda: reader.read(100), b""))
+    expected = BinaryCopyReader((str(i), wkb, "{}") for i in range(1000)).read()
+    assert first + rest == expected
+    assert len(consumed) == 1000
+
+
+def test_load_geoms_insert_or_copy(monkeypatch):
+    """Test one page of rows is INSERTed, and anything larger is COPYed."""
+    calls = []
+    monkeypatch.setattr(
+        db, "insert_geoms", lambda cur, table, rows: calls.append(("insert", rows))
+    )
+    monkeypatch.setattr(
+        db, "copy_geoms", lambda cur, table, rows: calls.append(("copy", list(rows)))
+    )
+    rows = [(str(i), b"", "{}") for i in range(INSERT_PAGE_SIZE + 1)]
+
+    # Rows may be a generator, consumed only once
+    load_geoms(None, "ways_poly", (row for row in rows[:INSERT_PAGE_SIZE]))
+    load_geoms(None, "ways_poly", (row for row in rows))
+    load_geoms(None, "ways_poly", iter([]))
+
+    assert calls == [("insert", rows[:INSERT_PAGE_SIZE]), ("copy", rows)]
+
+
+def test_create_connection_session_settings(monkeypatch):
+    """Test session settings are only sent when opted in."""
+    calls = []
+    monkeypatch.setattr(
+        db.psycopg2, "connect", lambda *args, **kwargs: calls.append(kwargs)
+    )
+    create_connection("postgresql://localhost/splitter")
+    create_connection("postgresql://localhost/splitter", BULK_SESSION_SETTINGS)
+
+    assert calls[0] == {}
+    assert "-c synchronous_commit=off" in calls[1]["options"]
+
+
+def test_insert_geom_single_row(monkeypatch):
+    """Test the single row helper passes WKB and JSON to insert_geoms."""
+    calls = []
+    monkeypatch.setattr(
+        db, "insert_geoms", lambda cur, table, rows: calls.append((table, rows))
+    )
+    point = Point(85.3, 27.7)
+    insert_geom(None, "ways_poly", osm_id=1, geom=point.wkb_hex, tags={"a": "b"})
+
+    assert calls == [("ways_poly", [(1, point.wkb, '{"a": "b"}')])]
+
+
+def test_setup_tables_lines_view_opt_in():
+    """Test lines_view and aoi_parts are only created when requested."""
+    cur = RecordingCursor()
+    conn = SimpleNamespace(cursor=lambda: cur)
+    aoi = Point(85.3, 27.7).buffer(0.01)
+
+    setup_tables(conn, aoi)
+    setup_tables(conn, aoi, lines_view=True)
+
+    assert "CREATE TEMP VIEW lines_view" not in cur.executed[0]
+    assert "CREATE TEMP TABLE aoi_parts" not in cur.executed[0]
+    assert "CREATE TEMP VIEW lines_view" in cur.executed[1]
@@ -19,13 +19,20 @@
 
 import json
 import logging
+import subprocess
+import sys
+from io import BytesIO
 from pathlib import Path
 from time import sleep
 from uuid import uuid4
 
 import geojson
+import numpy as np
 import pytest
+import shapely
+from urllib3.exceptions import ProtocolError
 
+from fmtm_splitter import overpass
 from fmtm_splitter.splitter import (
     FMTMSplitter,
     main,
@@ -61,6 +68,59 @@ def test_init_splitter_types(aoi_json):
     assert str(error.value) == "The input AOI cannot contain multiple geometries."
 
 
+def test_geojson_to_shapely_array():
+    """Test geometries are parsed from dicts, shapely and __geo_interface__."""
+
+    class GeoInterface:
+        __geo_interface__ = {"type": "Point", "coordinates": [1.0, 2.0]}
+
+    geoms = FMTMSplitter.geojson_to_shapely_array(
+        [
+            {"type": "Point", "coordinates": [0.0, 0.0]},
+            shapely.box(0, 0, 1, 1),
+            GeoInterface(),
+            geojson.Point((3.0, 4.0)),
+        ]
+    )
+    assert shapely.equals(
+        geoms,
+        [
+            shapely.Point(0, 0),
+            shapely.box(0, 0, 1, 1),
+            shapely.Point(1, 2),
+            shapely.Point(3, 4),
+        ],
+    ).all()
+    assert len(FMTMSplitter.geojson_to_shapely_array([])) == 0
+
+
+def test_meters_to_degrees_arrays(aoi_json):
+    """Test array inputs convert the same as one scalar at a time."""
+    splitter = FMTMSplitter(aoi_json)
+    meters = np.array([50.0, 100.0, 1000.0])
+    lats = np.array([0.0, 27.7, -60.0])
+    lat_degs, lon_degs = splitter.meters_to_degrees(meters, lats)
+    for index, (meter, lat) in enumerate(zip(meters, lats, strict=True)):
+        lat_deg, lon_deg = splitter.meters_to_degrees(float(meter), float(lat))
+        assert lat_degs[index] == pytest.approx(lat_deg)
+        assert lon_degs[index] == pytest.approx(lon_deg)
+    # One degree of latitude is roughly 110.6km at the equator
+    assert lat_degs[0] == pytest.approx(50 / 110574, rel=1e-3)
+
+
+def test_clip_to_aoi_threaded(aoi_json, monkeypatch):
+    """Test threaded clipping matches a single intersection call."""
+    splitter = FMTMSplitter(aoi_json)
+    xmin, ymin, xmax, ymax = splitter.aoi.bounds
+    xs = np.linspace(xmin, xmax, 3000)
+    cells = shapely.box(xs, ymin, xs + (xmax - xmin) / 10, ymax)
+
+    monkeypatch.setattr("os.cpu_count", lambda: 4)
+    clipped = splitter.clip_to_aoi(cells)
+    assert len(clipped) == len(cells)
+    assert shapely.equals(clipped, shapely.intersection(cells, splitter.aoi)).all()
+
+
 def test_split_by_square_with_dict(db, aoi_json, extract_json):
     """Test divide by square from geojson dict types."""
     features = split_by_square(
@@ -76,6 +136,26 @@ def test_split_by_square_with_dict(db, aoi_json, extract_json):
     assert len(features.get("features")) == 66
 
 
+def test_split_by_square_output_format(db, aoi_json, extract_json):
+    """Test square split features keep the ST_AsGeoJSON output format."""
+    features = split_by_square(aoi_json, db, meters=50, osm_extract=extract_json)
+    feature = features.get("features")[0]
+    assert set(feature) == {"type", "properties", "geometry"}
+    assert set(feature["properties"]) == {"area"}
+    ring = feature["geometry"]["coordinates"][0]
+    assert isinstance(ring, list)
+    assert all(isinstance(coord, list) for coord in ring)
+    # ST_AsGeoJSON rounds to 9 decimal places by default
+    assert all(coord == [round(x, 9) for x in coord] for coord in ring)
+
+    # No cells contain an extract feature, so PostGIS aggregated nothing
+    empty_extract = geojson.FeatureCollection(
+        [geojson.Feature(geometry=geojson.Point((0.0, 0.0)))]
+    )
+    features = split_by_square(aoi_json, db, meters=50, osm_extract=empty_extract)
+    assert features == {"type": "FeatureCollection", "features": None}
+
+
 def test_split_by_square_with_str(db, aoi_json, extract_json):
     """Test divide by square from geojson str and file."""
     # GeoJSON Dumps
@@ -152,6 +232,47 @@ def test_split_by_features_geojson(aoi_json):
     assert len(features.get("features")) == 4
 
 
+def test_split_by_features_shapely_geometries(aoi_json):
+    """Test splitting by features with shapely geometries, not GeoJSON."""
+    with open("tests/testdata/kathmandu_split.geojson") as jsonfile:
+        split_featcol = geojson.load(jsonfile)
+    features = FMTMSplitter(aoi_json).splitByFeature(
+        {
+            "features": [
+                {"geometry": shapely.geometry.shape(feature["geometry"])}
+                for feature in split_featcol["features"]
+            ]
+        }
+    )
+    assert len(features.get("features")) == 4
+
+
+def test_split_by_features_single_polygon():
+    """Test a clip giving a single Polygon, rather than a multi-part geometry."""
+    splitter = FMTMSplitter(shapely.geometry.mapping(shapely.box(0, 0, 10, 10)))
+    features = splitter.splitByFeature(
+        {"features": [{"geometry": shapely.geometry.mapping(shapely.box(2, 2, 4, 4))}]}
+    )
+    assert len(features.get("features")) == 1
+    geometry = shapely.geometry.shape(features.get("features")[0]["geometry"])
+    assert geometry.equals(shapely.box(2, 2, 4, 4))
+
+
+def test_output_geojson(aoi_json, tmp_path):
+    """Test split features are written as a valid FeatureCollection."""
+    splitter = FMTMSplitter(aoi_json)
+    feature = {
+        "type": "Feature",
+        "properties": {"area": 1.5},
+        "geometry": {"type": "Point", "coordinates": [85.3, 27.7]},
+    }
+    outfile = tmp_path / "output.geojson"
+    for features in ([], [feature], [feature] * 3, None):
+        splitter.split_features = {"type": "FeatureCollection", "features": features}
+        splitter.outputGeojson(str(outfile))
+        assert json.loads(outfile.read_text()) == splitter.split_features
+
+
 def test_split_by_sql_fmtm_with_extract(db, aoi_json, extract_json, output_json):
     """Test divide by square from geojson file."""
     features = split_by_sql(
@@ -164,6 +285,89 @@ def test_split_by_sql_fmtm_with_extract(db, aoi_json, extract_json, output_json)
     assert sorted(features) == sorted(output_json)
 
 
+def test_split_by_sql_fmtm_with_shapely_extract(db, aoi_json, extract_json):
+    """Test extract geometries may be shapely objects, not only GeoJSON."""
+    shapely_extract = {
+        "type": "FeatureCollection",
+        "features": [
+            {**feature, "geometry": shapely.geometry.shape(feature["geometry"])}
+            for feature in extract_json["features"]
+        ],
+    }
+    features = split_by_sql(
+        aoi_json,
+        db,
+        num_buildings=5,
+        osm_extract=shapely_extract,
+    )
+    assert len(features.get("features")) == 68
+
+
+def test_split_by_sql_fmtm_single_task(db, aoi_json, extract_json):
+    """Test AOI with fewer buildings than requested is returned as one task."""
+    features = split_by_sql(
+        aoi_json,
+        db,
+        num_buildings=100000,
+        osm_extract=extract_json,
+    )
+    assert len(features.get("features")) == 1
+    assert features.get("features")[0].get("properties").get("building_count") > 0
+
+
+def test_split_by_sql_fmtm_single_task_split_lines(db, aoi_json, caplog):
+    """Test an AOI with few buildings is still split by a crossing river."""
+    xmin, ymin, xmax, ymax = FMTMSplitter(aoi_json).aoi.bounds
+    xmid, ymid = (xmin + xmax) / 2, (ymin + ymax) / 2
+    building = geojson.Feature(
+        geometry=geojson.Polygon(
+            [
+                [
+                    (xmid, ymid + 0.0001),
+                    (xmid + 0.0001, ymid + 0.0001),
+                    (xmid + 0.0001, ymid + 0.0002),
+                    (xmid, ymid + 0.0001),
+                ]
+            ]
+        ),
+        properties={"osm_id": 1, "tags": {"building": "yes"}},
+    )
+    river = geojson.Feature(
+        geometry=geojson.LineString([(xmin - 0.01, ymid), (xmax + 0.01, ymid)]),
+        properties={"osm_id": 2, "tags": {"waterway": "river"}},
+    )
+    extract = geojson.FeatureCollection([building, river])
+
+    with caplog.at_level(logging.INFO):
+        split_by_sql(aoi_json, db, num_buildings=100000, osm_extract=extract)
+    assert "returning as single task" not in caplog.text
+
+
+def test_split_by_sql_custom_sql_no_single_task(db, aoi_json, extract_json, tmp_path):
+    """Test custom SQL is run, even with fewer buildings than requested."""
+    sql_file = tmp_path / "custom.sql"
+    sql_file.write_text(
+        """
+        SELECT jsonb_build_object(
+            'type', 'FeatureCollection',
+            'features', jsonb_agg(jsonb_build_object(
+                'type', 'Feature',
+                'geometry', ST_AsGeoJSON(geom)::jsonb,
+                'properties', jsonb_build_object('custom', true)
+            ))
+        ) FROM project_aoi;
+        """
+    )
+    features = split_by_sql(
+        aoi_json,
+        db,
+        sql_file=sql_file,
+        num_buildings=100000,
+        osm_extract=extract_json,
+    )
+    assert features.get("features")[0].get("properties") == {"custom": True}
+
+
 def test_split_by_sql_fmtm_no_extract(aoi_json):
     """Test FMTM splitting algorithm, with no data extract."""
     features = split_by_sql(
@@ -336,3 +540,121 @@ def test_split_by_sql_cli_no_extract():
     # NOTE This may change over time as it calls the live API
     # so we set to >= the output from test_split_by_sql_cli
     assert len(output_geojson.get("features")) >= 44
+
+
+def test_overpass_query_streams_with_timeout(tmp_path, monkeypatch):
+    """Test Overpass responses are streamed to file, with a request timeout."""
+    requests_made = []
+
+    class FakeResponse:
+        status_code = 200
+        raw = BytesIO(b"<osm></osm>")
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    def fake_get(url, **kwargs):
+        requests_made.append(kwargs)
+        return FakeResponse()
+
+    monkeypatch.setattr(overpass.session, "get", fake_get)
+    outfile = str(tmp_path / "out.osm")
+    assert overpass.query("node;out;", "https://overpass", outfile) == outfile
+    assert Path(outfile).read_bytes() == b"<osm></osm>"
+    assert requests_made[0]["timeout"] == overpass.OVERPASS_TIMEOUT
+
+
+def test_overpass_query_interrupted(tmp_path, monkeypatch):
+    """Test an interrupted Overpass response leaves no partial file."""
+
+    class BrokenStream(BytesIO):
+        def read(self, *args):
+            raise ConnectionError("Connection reset")
+
+    class FakeResponse:
+        status_code = 200
+        raw = BrokenStream()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(overpass.session, "get", lambda url, **kwargs: FakeResponse())
+    outfile = tmp_path / "out.osm"
+    assert overpass.query("node;out;", "https://overpass", str(outfile)) is None
+    assert not outfile.exists()
+
+
+def test_overpass_query_to_db_interrupted(monkeypatch):
+    """Test osm2pgsql is killed if the streamed response is interrupted."""
+
+    class BrokenStream(BytesIO):
+        def read(self, *args):
+            if self.tell():
+                raise ProtocolError("Connection broken")
+            return super().read(*args)
+
+    class FakeResponse:
+        status_code = 200
+        raw = BrokenStream(b"<osm>")
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    # Stands in for osm2pgsql, reading the pipe until EOF then succeeding
+    reader = "import sys; open(sys.argv[1], 'rb').read()"
+    monkeypatch.setattr(overpass.session, "get", lambda url, **kwargs: FakeResponse())
+    monkeypatch.setattr(
+        overpass,
+        "osm2pgsql_cmd",
+        lambda infile, dbd: [sys.executable, "-c", reader, infile],
+    )
+    assert overpass.query_to_db("node;out;", "https://overpass", None) == 1
+
+
+def test_overpass_cli_query_failure(tmp_path):
+    """Test the Overpass CLI exits before osm2pgsql if the query failed."""
+    query_file = tmp_path / "query.overpassql"
+    query_file.write_text("node({{bbox}});out;")
+    result = subprocess.run(
+        [
+            sys.executable,
+            "fmtm_splitter/overpass.py",
+            "--query",
+            str(query_file),
+            "--boundary",
+            "tests/testdata/kathmandu.geojson",
+            # Nothing listens on the discard port, so the request fails fast
+            "--overpass_url",
+            "http://127.0.0.1:9/api/interpreter",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode != 0
+    assert "nothing to push to the database" in result.stderr
+    assert "osm2pgsql" not in result.stdout
+
+
+def test_overpass_aoiextent(tmp_path):
+    """Test the AOI bbox is given in Overpass (south, west, north, east) order."""
+    aoi_file = tmp_path / "aoi.geojson"
+    aoi_file.write_text(
+        json.dumps(
+            geojson.FeatureCollection(
+                [
+                    geojson.Feature(geometry=shapely.box(85.3, 27.7, 85.31, 27.72)),
+                    geojson.Feature(geometry=shapely.box(85.29, 27.71, 85.3, 27.73)),
+                ]
+            )
+        )
+    )
+    assert overpass.aoiextent(str(aoi_file)) == "27.7,85.29,27.73,85.31"